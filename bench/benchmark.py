@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#######################################################################
+#  benchmark.py                                                       #
+#                                                                     #
+#  Times the send/parse/write path against the fake ngFEC.exe in this #
+#  directory and statPlot on synthetic logs, and saves the results to #
+#  JSON so runs can be compared:                                      #
+#                                                                     #
+#  ./bench/benchmark.py -o bench_results.json                         #
+#                                                                     #
+#  Benchmarks that need ROOT (ngfec_auto, statPlot) are skipped when  #
+#  it cannot be imported.                                             #
+#                                                                     #
+#######################################################################
+
+import os
+import sys
+import json
+import shutil
+import random
+import tempfile
+import platform
+from time import time
+from datetime import datetime
+from argparse import ArgumentParser
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, repo_dir)
+# send_commands spawns "ngFEC.exe", so put the fake first on the PATH
+os.environ["PATH"] = bench_dir + os.pathsep + os.environ.get("PATH", "")
+
+from sendCommands import send_commands, close_sessions
+from logIndex import readLines, updateIndex
+
+def timeit(fn, repeat):
+    """
+    Calls fn repeat times and returns the min/mean/max wall time in seconds
+    """
+    times = []
+    for i in xrange(repeat):
+        t0 = time()
+        fn()
+        times.append(time() - t0)
+    return {"n": repeat, "min": min(times), "mean": sum(times) / len(times), "max": max(times)}
+
+def fake(latency=0, truncate=0, error=0):
+    # Configure the fake ngFEC.exe spawned by the next session
+    os.environ["FAKE_NGFEC_LATENCY"] = str(latency)
+    os.environ["FAKE_NGFEC_TRUNCATE"] = str(truncate)
+    os.environ["FAKE_NGFEC_ERROR"] = str(error)
+    close_sessions()
+
+def writeSyntheticLog(path, nLines, nValues=313):
+    # Same shape as an HB ngfec_auto log: date, time, then nValues floats
+    row = " ".join("{0:.3f}".format(random.uniform(0, 40)) for i in xrange(nValues))
+    with open(path, "w") as f:
+        for i in xrange(nLines):
+            f.write("2017-07-05 12:%02d:%02d %s \n" % (i / 60 % 60, i % 60, row))
+
+def benchSend(cmds, args, results):
+    fake(latency=args.latency)
+    results["send_script"] = timeit(lambda: send_commands(cmds=list(cmds), script=True, port=1, control_hub="fake"), args.repeat)
+    results["send_interactive"] = timeit(lambda: send_commands(cmds=list(cmds), script=False, port=1, control_hub="fake"), args.repeat)
+    results["send_persistent"] = timeit(lambda: send_commands(cmds=list(cmds), script=True, port=1, control_hub="fake", persistent=True), args.repeat)
+    close_sessions()
+
+def benchReading(cmds, args, results, work):
+    try:
+        import ngfec_auto
+        from rootWriter import RootWriter
+    except ImportError as e:
+        print "Skipping ngfec_auto benchmarks:", e
+        results["ngfec_auto"] = {"skipped": str(e)}
+        return
+    for name, truncate in [("ngfec_auto", 0), ("ngfec_auto_retry", args.truncate)]:
+        fake(latency=args.latency, truncate=truncate)
+        writer = RootWriter(os.path.join(work, name))
+        log = os.path.join(work, name + ".log")
+        results[name] = timeit(lambda: ngfec_auto.takeReading(list(cmds), log, 1, writer=writer), args.repeat)
+        writer.close()
+    close_sessions()
+
+def benchLogs(args, results, work):
+    try:
+        import statPlot
+    except ImportError as e:
+        print "Skipping statPlot benchmarks:", e
+        statPlot = None
+    for size in args.sizes:
+        log = os.path.join(work, "synthetic_%d.log" % size)
+        writeSyntheticLog(log, size)
+        key = "log_%d" % size
+        results[key + "_index"] = timeit(lambda: updateIndex(log), 1)
+        results[key + "_tail"] = timeit(lambda: readLines(log, -10), args.repeat)
+        if statPlot is not None and size <= args.full_max:
+            variables = ["temps", "hums", "peltV", "peltI", "BVin", "Vin", "leakI", "cardT", "calibT", "setV", "targetT"]
+            def parse():
+                readings, values = statPlot.readTextLog(log, 0, 0, variables)
+                state = {}
+                for v in variables:
+                    statPlot.updateHisto(state, v, values[v])
+            results[key + "_statPlot"] = timeit(parse, 1)
+        os.remove(log)
+        os.remove(log + ".idx")
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--cmds",     "-c", default=os.path.join(repo_dir, "HBcommandList.txt"), help="command list to send")
+    parser.add_argument("--out",      "-o", default="bench_results.json", help="JSON file to save results in")
+    parser.add_argument("--repeat",   "-r", type=int, default=5, help="times to repeat each benchmark")
+    parser.add_argument("--latency",  "-l", type=float, default=0.0, help="fake ngFEC latency per command (s)")
+    parser.add_argument("--truncate", "-t", type=float, default=0.3, help="fraction of results truncated in the retry benchmark")
+    parser.add_argument("--sizes",    "-s", default="1000,100000,1000000", help="synthetic log sizes (lines)")
+    parser.add_argument("--full_max", "-f", type=int, default=100000, help="largest synthetic log to fully parse with statPlot")
+    args = parser.parse_args()
+    args.sizes = list(int(s) for s in args.sizes.split(","))
+    args.out = os.path.abspath(args.out)
+
+    with open(args.cmds) as f:
+        cmds = list(line.strip() for line in f if line.strip())
+    results = {}
+    work = tempfile.mkdtemp(prefix="he_bench_")
+    cwd = os.getcwd()
+    try:
+        os.chdir(work)      # ngFEC scripts are written to the working directory
+        benchSend(cmds, args, results)
+        benchReading(cmds, args, results, work)
+        benchLogs(args, results, work)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work)
+
+    report = {
+        "date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "args": vars(args),
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for name in sorted(results):
+        print "{0:<28} {1}".format(name, results[name])
+    print "Saved results to", args.out
+
+if __name__ == "__main__":
+    sys.exit(main())
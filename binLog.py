@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#######################################################################
+#  binLog.py                                                          #
+#                                                                     #
+#  Compact binary alternative to the ngfec_auto text log. A file is   #
+#  a header followed by fixed-width records:                          #
+#                                                                     #
+#  header : "HEMONBIN", version (uint32), schema length (uint32),     #
+#           schema (JSON list of [variable, number of values])        #
+#  record : time (float64, seconds since epoch),                      #
+#           values (float32 each, variables in schema order)          #
+#                                                                     #
+#  loadBinLog memory-maps the records, so reading a few columns or    #
+#  the last few entries does not parse the rest of the file.          #
+#                                                                     #
+#######################################################################
+
+import os
+import json
+import struct
+import numpy as np
+
+MAGIC = "HEMONBIN"
+VERSION = 1
+r_header = struct.Struct("<8sII")
+
+# Schemas of files already checked by this process, keyed by path
+schemas = {}
+
+def isBinLog(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+def readHeader(f):
+    """
+    Returns (schema, offset of the first record) of an open binary log
+    """
+    magic, version, length = r_header.unpack(f.read(r_header.size))
+    if magic != MAGIC:
+        raise ValueError("Not a binary monitoring log")
+    if version != VERSION:
+        raise ValueError("Unsupported binary log version {0}".format(version))
+    schema = [(str(v), int(n)) for v, n in json.loads(f.read(length))]
+    return schema, r_header.size + length
+
+def writeHeader(f, schema):
+    encoded = json.dumps([[v, n] for v, n in schema])
+    f.write(r_header.pack(MAGIC, VERSION, len(encoded)))
+    f.write(encoded)
+
+def recordDtype(schema):
+    # One float64 time and one float32 sub-array per variable
+    return np.dtype([("time", "<f8")] + [(v, "<f4", (n,)) for v, n in schema])
+
+def appendRecord(path, timestamp, schema, record):
+    """
+    Append one reading whose values are already a float32 array in
+    schema order (e.g. Reading.buffer). The array is written as is.
+    """
+    schema = [(v, n) for v, n in schema]
+    if len(record) != sum(n for v, n in schema):
+        raise ValueError("Record has {0} values, schema expects {1}".format(len(record), sum(n for v, n in schema)))
+    with open(path, "ab+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            writeHeader(f, schema)
+        elif path not in schemas:
+            f.seek(0)
+            schemas[path] = readHeader(f)[0]
+            f.seek(0, os.SEEK_END)
+        if schemas.setdefault(path, schema) != schema:
+            raise ValueError("Reading does not match the schema of {0}".format(path))
+        f.write(struct.pack("<d", timestamp))
+        f.flush()
+        record.tofile(f)
+
+def replaceLastRecord(path, timestamp, record):
+    """
+    Overwrite the last record of a binary log, e.g. an aggregate that is
+    still being updated. record is a float32 array as for appendRecord.
+    """
+    with open(path, "r+b") as f:
+        f.seek(-(8 + 4 * len(record)), os.SEEK_END)
+        f.write(struct.pack("<d", timestamp))
+        f.flush()
+        record.tofile(f)
+
+def loadBinLog(path, start=0, stop=None):
+    """
+    Memory-maps a binary log. Returns (schema, records) where records is
+    a structured numpy array with a "time" column and one (entries x n)
+    column per variable. start/stop select records like a slice.
+    """
+    with open(path, "rb") as f:
+        schema, offset = readHeader(f)
+    dtype = recordDtype(schema)
+    nRecords = (os.path.getsize(path) - offset) // dtype.itemsize
+    if nRecords == 0:
+        return schema, np.zeros(0, dtype=dtype)
+    records = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(nRecords,))
+    return schema, records[start:stop]
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+#######################################################################
+#  collector.py                                                       #
+#                                                                     #
+#  Resident collector. Keeps the ngFEC session to one ngccm server    #
+#  (--port) and one TCP connection to the torch power supply open,    #
+#  takes a reading every --step seconds and records the RBX values    #
+#  and the power supply voltage/current together:                     #
+#                                                                     #
+#  nohup ./collector.py commandList.txt -o rbx.log &                  #
+#                                                                     #
+#  To read several ngccm servers run one collector per server, each   #
+#  with its own --port, --log, --records, --latest and --socket.      #
+#  --stats, --rollup and --metrics work as for ngfec_auto.py.         #
+#                                                                     #
+#  Every reading goes to the usual text log and ROOT files, and a     #
+#  record with both is appended to --records (JSON lines) and written #
+#  to --latest. The latest record can also be fetched from the unix   #
+#  socket --socket (collector.sock next to this script), which        #
+#  forwards power supply commands as well:                            #
+#                                                                     #
+#  ./collector.py --get                 (latest record)               #
+#  ./collector.py --send "V2O?;I2O?"    (power supply command)        #
+#                                                                     #
+#######################################################################
+
+import os
+import re
+import sys
+import json
+import socket
+import threading
+import subprocess
+import SocketServer
+from time import time, sleep
+from datetime import datetime
+from argparse import ArgumentParser
+from dispatch import getCmdList, makeReading
+from scheduling import schedule, writeLog
+
+# Regex to search for the value in a power supply reply, e.g. "12.000V"
+r_value = re.compile(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?")
+
+# Unix socket the collector serves on, the same wherever clients are started from
+socket_default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "collector.sock")
+
+class TorchClient(object):
+    """
+    Persistent connection to the torch power supply's TCP server (what
+    torch_i.sh/torch_v.sh used to reach with nc). Commands are separated
+    by ";" and every query (a command ending in "?") gets a one-line
+    reply. The server only has to listen on its own host: with ssh set,
+    host and port are reached through an ssh tunnel to that machine,
+    which stays open as long as the client.
+    """
+    def __init__(self, host = "localhost", port = 39221, timeout = 5, ssh = None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.ssh = ssh
+        self.tunnel = None      # ssh process forwarding localPort to host:port on the ssh machine
+        self.localPort = None
+        self.sock = None
+        self.lock = threading.Lock()    # The poll loop and socket clients share the connection
+
+    def openTunnel(self):
+        # Forward a free local port to the server, as seen from the ssh host
+        probe = socket.socket()
+        probe.bind(("localhost", 0))
+        self.localPort = probe.getsockname()[1]
+        probe.close()
+        self.tunnel = subprocess.Popen(["ssh", "-N", "-o", "ExitOnForwardFailure=yes", "-o", "BatchMode=yes",
+                                        "-L", "{0}:{1}:{2}".format(self.localPort, self.host, self.port), self.ssh])
+
+    def address(self):
+        if self.ssh is None:
+            return (self.host, self.port)
+        if self.tunnel is None or self.tunnel.poll() is not None:
+            self.openTunnel()
+        return ("localhost", self.localPort)
+
+    def connect(self):
+        self.close()
+        address = self.address()
+        deadline = time() + self.timeout
+        while True:
+            try:
+                self.sock = socket.create_connection(address, self.timeout)
+                break
+            except socket.error:
+                # A new tunnel takes a moment to listen
+                if self.ssh is None or time() > deadline or self.tunnel.poll() is not None:
+                    raise
+                sleep(0.1)
+        self.f = self.sock.makefile("rb")
+
+    def close(self, tunnel = False):
+        if self.sock is not None:
+            try:
+                self.f.close()
+                self.sock.close()
+            except socket.error:
+                pass
+        self.sock = None
+        if tunnel and self.tunnel is not None:
+            if self.tunnel.poll() is None:
+                self.tunnel.terminate()
+                self.tunnel.wait()
+            self.tunnel = None
+
+    def _query(self, cmds):
+        replies = []
+        for cmd in cmds:
+            self.sock.sendall(cmd + "\n")
+            if cmd.endswith("?"):
+                reply = self.f.readline()
+                if not reply:
+                    raise socket.error("Power supply closed the connection")
+                replies.append(reply.strip())
+        return replies
+
+    def query(self, cmd):
+        """
+        Sends a command such as "V2O?;I2O?" and returns the list of replies
+        to its queries. Reconnects and tries once more if the connection dropped.
+        """
+        cmds = [c.strip() for c in cmd.split(";") if c.strip()]
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self.connect()
+                return self._query(cmds)
+            except socket.error:
+                self.connect()
+                return self._query(cmds)
+
+    def read(self, channel = 2):
+        # Output voltage and current of a channel
+        replies = self.query("V{0}O?;I{0}O?".format(channel))
+        values = []
+        for reply in replies:
+            found = r_value.findall(reply)
+            values.append(float(found[-1]) if found else -1)
+        return {"V": values[0], "I": values[1]}
+
+class Collector(object):
+    """
+    Takes readings with ngfec_auto.takeReading, reusing one Reading and
+    the pooled ngFEC session, and keeps the latest record for clients.
+    """
+    def __init__(self, cmdList, log, port, torch = None, records = "collector.jsonl", latest = "latest.json", writer = None, binLog = None,
+                 stats = None, metrics = None, rollup = None):
+        self.cmdList = cmdList
+        self.log = log
+        self.port = port
+        self.torch = torch
+        self.records = records
+        self.latestFile = latest
+        self.writer = writer
+        self.binLog = binLog
+        self.stats = stats
+        self.metrics = metrics
+        self.rollup = rollup
+        self.reading = makeReading(cmdList)
+        self.latest = None
+        self.lock = threading.Lock()
+
+    def poll(self, run):
+        # ngfec_auto loads ROOT, which the --get/--send clients don't need
+        from ngfec_auto import takeReading
+        reading = takeReading(self.cmdList, self.log, self.port, run, self.writer, self.binLog, self.stats, self.metrics,
+                              reading = self.reading, rollup = self.rollup)
+        record = {
+            "date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "time": reading.timestamp,
+            "run": run,
+            "retries": int(reading.retries[0]),
+            "values": dict((v, [float("%.7g" % x) for x in reading[v]]) for v in reading),
+        }
+        if self.torch is not None:
+            try:
+                record["torch"] = self.torch.read()
+            except (socket.error, IndexError) as e:
+                record["torch"] = None
+                record["torchError"] = str(e)
+        encoded = json.dumps(record, sort_keys = True)
+        with self.lock:
+            self.latest = encoded
+        if self.records is not None:
+            with open(self.records, "a") as f:
+                f.write(encoded + "\n")
+        if self.latestFile is not None:
+            # Replace the file in one step so readers never see half a record
+            with open(self.latestFile + ".tmp", "w") as f:
+                f.write(encoded + "\n")
+            os.rename(self.latestFile + ".tmp", self.latestFile)
+        return record
+
+    def handle(self, request):
+        """
+        Answers one socket request: "latest" (or nothing) returns the
+        latest record, "torch <command>" forwards a power supply command.
+        """
+        words = request.strip().split(None, 1)
+        if not words or words[0] == "latest":
+            with self.lock:
+                return self.latest if self.latest is not None else "{}"
+        if words[0] == "torch" and len(words) == 2:
+            if self.torch is None:
+                return "ERROR: no power supply connection"
+            try:
+                return "\n".join(self.torch.query(words[1]))
+            except socket.error as e:
+                return "ERROR: %s" % e
+        return "ERROR: unknown request %r" % request.strip()
+
+    def serve(self, path):
+        # Answer clients on a unix socket from a background thread
+        collector = self
+        class Handler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                self.wfile.write(collector.handle(self.rfile.readline()) + "\n")
+        class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+            daemon_threads = True
+        if os.path.exists(path):
+            os.remove(path)     # Left over from a previous collector
+        server = Server(path, Handler)
+        thread = threading.Thread(target = server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+def request(path, line):
+    # Send one request to a running collector and return its answer
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.sendall(line + "\n")
+    sock.shutdown(socket.SHUT_WR)
+    reply = ""
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        reply += data
+    sock.close()
+    return reply
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("cmds", nargs="?", default="commandList.txt", help="text file containing list of ngFEC commands")
+    parser.add_argument("--log",       "-o", default="rbx.log", help="log file to save stats in")
+    parser.add_argument("--port",      "-p", default=64000, help="port for ngccm server")
+    parser.add_argument("--step",      "-s", default=20, help="step time in seconds between readings")
+    parser.add_argument("--policy",          default="skip", help="what to do with steps missed by a slow reading (skip or compress)")
+    parser.add_argument("--root",      "-t", default="power_test", help="prefix of the ROOT files to append readings to")
+    parser.add_argument("--bin",       "-b", default=None, help="binary log file to also save stats in")
+    parser.add_argument("--stats",     "-a", default=None, help="checkpoint file of running statistics (enables alarms)")
+    parser.add_argument("--alarmConfig",     default=None, help="JSON file of alarm thresholds")
+    parser.add_argument("--alarmLog",        default="alarms.log", help="log file to save alarms in")
+    parser.add_argument("--rollup",          default=None, help="prefix of min/mean/max rollup files to update")
+    parser.add_argument("--metrics",         default=None, help="JSON lines file to append timing metrics to")
+    parser.add_argument("--prom",            default=None, help="Prometheus text file to write timing metrics to")
+    parser.add_argument("--torchHost",       default="localhost", help="host of the torch power supply server (as seen from --torchSsh)")
+    parser.add_argument("--torchPort",       default=39221, help="port of the torch power supply server")
+    parser.add_argument("--torchSsh",        default=None, help="reach the power supply server through an ssh tunnel to this host")
+    parser.add_argument("--noTorch",         action="store_true", help="don't read the power supply")
+    parser.add_argument("--records",   "-r", default="collector.jsonl", help="JSON lines file to save records in")
+    parser.add_argument("--latest",    "-l", default="latest.json", help="file to keep the latest record in")
+    parser.add_argument("--socket",          default=socket_default, help="unix socket to serve the latest record on")
+    parser.add_argument("--get",             action="store_true", help="print the latest record of a running collector")
+    parser.add_argument("--send",            default=None, help="send a command to the power supply through a running collector")
+    args = parser.parse_args()
+
+    if args.get:
+        sys.stdout.write(request(args.socket, "latest"))
+        return
+    if args.send is not None:
+        sys.stdout.write(request(args.socket, "torch " + args.send))
+        return
+
+    from ngfec_auto import control_hub
+    from rootWriter import RootWriter
+    from onlineStats import OnlineStats, loadConfig
+    from metrics import Metrics
+    from rollup import Rollup
+    torch = None if args.noTorch else TorchClient(args.torchHost, int(args.torchPort), ssh = args.torchSsh)
+    writer = RootWriter(args.root)
+    stats = None
+    if args.stats:
+        stats = OnlineStats(args.stats, loadConfig(args.alarmConfig), args.alarmLog)
+    metrics = None
+    if args.metrics or args.prom:
+        metrics = Metrics(args.metrics, args.prom, {"hub": control_hub, "port": args.port, "log": args.log})
+    rollup = Rollup(args.rollup) if args.rollup else None
+    collector = Collector(getCmdList(args.cmds), args.log, int(args.port), torch, args.records, args.latest, writer, args.bin,
+                          stats, metrics, rollup)
+    server = collector.serve(args.socket)
+    actionLog = "collector.log"
+    with open(actionLog, 'a') as f:
+        writeLog("Starting collector on port %s" % args.port, f)
+    try:
+        for runNum in schedule(int(args.step), sys.maxint, args.policy, actionLog):
+            try:
+                collector.poll(runNum)
+            except Exception as e:
+                # Keep collecting; the session is reconnected on the next reading
+                with open(actionLog, 'a') as f:
+                    writeLog("Reading %d failed: %s" % (runNum, e), f)
+    finally:
+        server.shutdown()
+        os.remove(args.socket)
+        writer.close()
+        if torch is not None:
+            torch.close(tunnel = True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+#!/bin/bash
+# Start the resident collector unless one is already answering on its socket.
+# Run on the DAQ host (e.g. from its crontab); the torch power supply server
+# on cms904usr only has to listen locally, it is reached through an ssh tunnel.
+pushd /home/daq/HE_Monitoring
+if ! ./collector.py --get > /dev/null 2>&1; then
+    nohup ./collector.py commandList.txt -o rbx.log --torchSsh cms904usr \
+        --stats rbx.stats.json --alarmLog rbx_alarms.log --rollup rbx_rollup --metrics rbx.metrics.jsonl >> collector.out 2>&1 &
+fi
+popd
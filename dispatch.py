@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#######################################################################
+#  dispatch.py                                                        #
+#                                                                     #
+#  Which variable and channels every ngFEC command of a command list  #
+#  fills, worked out once per command list. Kept apart from           #
+#  ngfec_auto.py, which loads ROOT, so the collector's clients and    #
+#  the tests can use it without ROOT:                                 #
+#                                                                     #
+#  expandCmd : the channel names of a command with [a-b] ranges       #
+#  getCmdLayout : channel names and expected values of every command  #
+#  variables : the variables logged, in log order (see loadVariables) #
+#  getDispatch : command -> (variable, channel slice, expected count) #
+#  makeReading : a Reading laid out for a command list                #
+#                                                                     #
+#######################################################################
+
+import re
+import json
+import itertools
+from reading import Reading, missing
+
+# get command list from file
+def getCmdList(cmdFile):
+    cmdList = []
+    with open(cmdFile, 'r') as f:
+        for line in f:
+            l = line.strip()
+            if l != "": # Only consider non-empty lines
+                cmdList.append(line.strip())
+    return cmdList
+
+# Split an ngccm channel pattern on its [a-b] ranges, e.g.
+# "HB0-[1-4]-[1-4]-B_SHT_temp_f" -> ["HB0-", "1", "4", "-", "1", "4", "-B_SHT_temp_f"]
+r_range = re.compile(r"\[(\d+)-(\d+)\]")
+
+# Expanded command lists, keyed by the tuple of commands
+layouts = {}
+
+# get the channel pattern from a command, e.g. "tget HE1-[1-4]-Vin_f fnr" -> "HE1-[1-4]-Vin_f"
+def getCmdPattern(cmd):
+    words = cmd.split()
+    if len(words) > 1 and words[0] in ["get", "tget", "put", "tput"]:
+        return words[1]
+    return cmd.strip()
+
+# iterate over the concrete channel names of a command with any number of ranges
+def expandCmd(cmd):
+    parts = r_range.split(getCmdPattern(cmd))
+    literals = parts[0::3]
+    ranges = [xrange(int(lo), int(hi)+1) for lo, hi in zip(parts[1::3], parts[2::3])]
+    for channel in itertools.product(*ranges):
+        joined = literals[0]
+        for i, value in enumerate(channel):
+            joined += str(value) + literals[i+1]
+        yield joined
+
+# get the channel names and expected number of values of every command, expanded once per command list
+def getCmdLayout(cmdList):
+    key = tuple(cmdList)
+    if key not in layouts:
+        layout = {"channels": {}, "expected": {}}
+        for cmd in cmdList:
+            layout["channels"][cmd] = list(expandCmd(cmd))
+            layout["expected"][cmd] = len(layout["channels"][cmd])
+        layouts[key] = layout
+    return layouts[key]
+
+# Variables that ngfec_auto reads, in the order they are logged:
+# (params key, regex matched against the channel pattern of a command, ROOT branch name)
+variables = [
+    ("temps",   r"-rtdtemperature(_f)?$",            "rtdtemperature"),
+    ("hums",    r"-humidityS?(_f)?$",                "humidity"),
+    ("peltV",   r"-PeltierVoltage(_f)?$",            "PeltierVoltage"),
+    ("peltI",   r"-PeltierCurrent(_f)?$",            "PeltierCurrent"),
+    ("BVin",    r"-BVin(_f)?$",                      "BVin"),
+    ("Vin",     r"-Vin(_f)?$",                       "Vin"),
+    ("leakI",   r"-LeakageCurrent\[\d+-\d+\](_f)?$", "LeakageCurrent"),
+    ("cardT",   r"-\[\d+-\d+\]-B_SHT_temp(_f)?$",   "qie_card_B_SHT_temp"),
+    ("calibT",  r"-calib-B_SHT_temp(_f)?$",          "calib_card_B_SHT_temp"),
+    ("setV",    r"-SetPeltierVoltage(_f)?$",         "SetPeltierVoltage"),
+    ("targetT", r"-peltier_targettemperature(_f)?$", "targettemperature"),
+]
+
+defaultNames = set(v[0] for v in variables)
+
+# Dispatch tables, keyed by the tuple of commands and the tuple of variables
+dispatches = {}
+
+def loadVariables(configFile):
+    """
+    Returns the default variables plus any declared in a JSON config, e.g.
+    [{"name": "hvMon", "match": "-HVmon_f$", "branch": "HVmon"}]
+    A declared variable with the name of a default one replaces it in
+    place; the others follow the defaults. The text log keeps the
+    default columns only (its readers assume that layout), so extra
+    variables are logged to the binary log and the ROOT files.
+    """
+    if configFile is None:
+        return list(variables)
+    with open(configFile, 'r') as f:
+        declared = json.load(f)
+    declared = [(str(v["name"]), str(v["match"]), str(v.get("branch", v["name"]))) for v in declared]
+    byName = dict((v[0], v) for v in declared)
+    return [byName.get(v[0], v) for v in variables] + [v for v in declared if v[0] not in defaultNames]
+
+def getDispatch(cmdList, variableList=None):
+    """
+    Matches every command to the variable it fills, once per command list.
+    Returns {"table": {cmd: (key, channel slice, expected count)},
+             "counts": {key: number of values}, "order": [key, ...],
+             "branches": {key: ROOT branch name}}.
+    A variable filled by several commands gets their channels in command
+    order; commands that match no variable are not in the table.
+    """
+    if variableList is None:
+        variableList = variables
+    key = (tuple(cmdList), tuple(variableList))
+    if key not in dispatches:
+        matchers = [(name, re.compile(match)) for name, match, branch in variableList]
+        expected = getCmdLayout(cmdList)["expected"]
+        dispatch = {"table": {}, "counts": {}, "order": [], "branches": {}}
+        for cmd in cmdList:
+            pattern = getCmdPattern(cmd)
+            for name, matcher in matchers:
+                if matcher.search(pattern):
+                    start = dispatch["counts"].get(name, 0)
+                    dispatch["table"][cmd] = (name, slice(start, start + expected[cmd]), expected[cmd])
+                    dispatch["counts"][name] = start + expected[cmd]
+                    break
+        for name, match, branch in variableList:
+            if name in dispatch["counts"]:
+                dispatch["order"].append(name)
+                dispatch["branches"][name] = branch
+        dispatches[key] = dispatch
+    return dispatches[key]
+
+# get command string from command list
+def getCmdString(cmdList):
+    joiner = "{:<40}"
+    layout = getCmdLayout(cmdList)
+    cmdString = ""
+    for cmd in cmdList:
+        for channel in layout["channels"][cmd]:
+            cmdString += joiner.format(channel)
+    return cmdString
+
+# make a Reading laid out for the variables read by a command list
+def makeReading(cmdList, variableList=None):
+    dispatch = getDispatch(cmdList, variableList)
+    return Reading([(key, dispatch["counts"][key]) for key in dispatch["order"]])
+
+# fill a command's channels of a Reading, leaving any missing values at -1
+def fillChannels(reading, entry, values):
+    key, channels, exp = entry
+    dest = reading[key][channels]
+    n = min(len(values), exp)
+    dest[:n] = values[:n]
+    dest[n:] = missing
@@ -1,5 +1,6 @@
 #!/bin/bash
+# Readings are taken by the resident collector; make sure it runs and update the plots
 pushd /home/daq/HE_Monitoring
-./ngfec_auto.py commandList.txt -o rbx.log
+./collector.sh
 ./statPlot.py rbx.log -n -10
 popd
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#######################################################################
+#  logIndex.py                                                        #
+#                                                                     #
+#  Random access to the lines of an ngfec_auto text log without       #
+#  scanning the whole file:                                           #
+#                                                                     #
+#  tailLines : seeks backwards from the end of the file, so reading   #
+#              the last N entries costs the same for any log size     #
+#  updateIndex : keeps a sidecar index (<log>.idx) with the byte      #
+#              offset of every line, appending only the lines added   #
+#              since it was last updated                              #
+#  readOffsets : seeks to the index entries that are needed           #
+#  readLines : returns lines first..last using whichever is cheaper   #
+#                                                                     #
+#######################################################################
+
+import os
+from array import array
+
+# Bytes read at a time when seeking backwards
+BLOCK = 65536
+
+def tailLines(path, n):
+    """
+    Returns the last n complete lines of a file. A last line without a
+    newline (still being written by ngfec_auto) is left out.
+    """
+    if n <= 0:
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = ""
+        # One more newline than lines wanted, since the log ends with one
+        while pos > 0 and data.count("\n") <= n:
+            step = min(BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    data = data[:data.rfind("\n") + 1]
+    lines = data.splitlines(True)
+    return lines[-n:]
+
+def indexName(path):
+    return path + ".idx"
+
+# Bytes per index entry
+ITEM = array("l").itemsize
+
+def readOffsets(path, entries):
+    """
+    Returns the byte offsets stored at the given entries of the sidecar
+    index, seeking to each instead of loading the whole index
+    """
+    offsets = array("l")
+    with open(indexName(path), "rb") as f:
+        for i in entries:
+            f.seek(i * ITEM)
+            offsets.fromstring(f.read(ITEM))
+    return offsets
+
+def updateIndex(path):
+    """
+    Appends the offsets of any lines added since last time to the
+    sidecar index and returns the number of lines indexed. Entry i of
+    the index is the byte offset of the start of line i + 1.
+    """
+    index = indexName(path)
+    size = os.path.getsize(path)
+    indexSize = os.path.getsize(index) if os.path.exists(index) else 0
+    entries = indexSize // ITEM
+    # The last entry is the end of the indexed part; rebuild if the log shrank
+    # or the index is damaged
+    end = readOffsets(path, [entries - 1])[0] if entries and indexSize % ITEM == 0 else None
+    if end is None or end > size:
+        with open(index, "wb") as f:
+            array("l", [0]).tofile(f)
+        entries, end = 1, 0
+    if end < size:
+        offsets = array("l")
+        with open(path, "rb") as f:
+            f.seek(end)
+            for line in f:
+                if not line.endswith("\n"):
+                    break # Leave a partially written line for next time
+                end += len(line)
+                offsets.append(end)
+        with open(index, "ab") as f:
+            offsets.tofile(f)
+        entries += len(offsets)
+    return entries - 1
+
+def readLines(path, first=0, last=0):
+    """
+    Returns [(line number, line), ...] for lines first..last (counting
+    from 1). Like statPlot's --min/--max, 0 means the start/end of the
+    file and negative values count backwards from the end.
+    """
+    if first < 0 and last <= 0:
+        # Only the end of the file is needed
+        lines = tailLines(path, -first)
+        drop = max(0, -last - 1)
+        lines = lines[:len(lines) - drop]
+        # Number lines from the end; the total count is not needed
+        return list((i - len(lines) - drop, line) for i, line in enumerate(lines))
+    lineCount = updateIndex(path)
+    lineStart = max(1, first if first >= 0 else lineCount + first + 1)
+    lineEnd = min(lineCount, last if last > 0 else lineCount + last + 1)
+    if lineEnd < lineStart:
+        return []
+    start, end = readOffsets(path, [lineStart - 1, lineEnd])
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return list((lineStart + i, line) for i, line in enumerate(data.splitlines(True)))
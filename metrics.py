@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#######################################################################
+#  metrics.py                                                         #
+#                                                                     #
+#  Per-cycle timing of the read path. takeReading fills a dictionary  #
+#  with                                                               #
+#                                                                     #
+#  spawn_time     : seconds spent starting ngFEC.exe (0 when the      #
+#                   persistent session was reused)                    #
+#  command_times  : round-trip seconds of each command                #
+#  bytes_read     : bytes of ngFEC output read                        #
+#  parse_time     : seconds spent extracting values from the output   #
+#  retries        : commands that had to be sent again                #
+#  root_time      : seconds spent filling/saving the ROOT tree        #
+#  log_time       : seconds spent writing the text and binary logs    #
+#  cycle_time     : total seconds for the reading                     #
+#                                                                     #
+#  and Metrics.emit appends it as a JSON line and/or rewrites a       #
+#  Prometheus text file for the node exporter's textfile collector:   #
+#                                                                     #
+#  ngfec_auto.py cmds.txt --metrics metrics.jsonl --prom hemon.prom   #
+#                                                                     #
+#######################################################################
+
+import os
+import json
+import time
+
+# Prometheus gauge name, help text and cycle key of each scalar metric
+gauges = [
+    ("hemon_cycle_seconds", "Total time of the last reading", "cycle_time"),
+    ("hemon_spawn_seconds", "Time spent starting ngFEC.exe", "spawn_time"),
+    ("hemon_bytes_read", "Bytes of ngFEC output read", "bytes_read"),
+    ("hemon_parse_seconds", "Time spent parsing ngFEC output", "parse_time"),
+    ("hemon_retries", "Commands sent again after a short result", "retries"),
+    ("hemon_root_write_seconds", "Time spent writing the ROOT tree", "root_time"),
+    ("hemon_log_write_seconds", "Time spent writing the text and binary logs", "log_time"),
+]
+
+def formatLabels(labels):
+    items = sorted(labels.items())
+    if not items:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+
+class Metrics(object):
+    """
+    Writes the metrics of each reading to a JSON lines file and/or a
+    Prometheus text file. labels (e.g. hub and port) are added to both.
+    """
+    def __init__(self, jsonLog = None, promFile = None, labels = None):
+        self.jsonLog = jsonLog
+        self.promFile = promFile
+        self.labels = labels if labels is not None else {}
+
+    def emit(self, cycle):
+        cycle = dict(cycle)
+        cycle.setdefault("timestamp", time.time())
+        cycle.update(self.labels)
+        if self.jsonLog is not None:
+            with open(self.jsonLog, "a") as f:
+                f.write(json.dumps(cycle, sort_keys=True) + "\n")
+        if self.promFile is not None:
+            self.writeProm(cycle)
+
+    def writeProm(self, cycle):
+        labels = formatLabels(self.labels)
+        lines = []
+        for name, text, key in gauges:
+            if key not in cycle:
+                continue
+            lines.append("# HELP %s %s" % (name, text))
+            lines.append("# TYPE %s gauge" % name)
+            lines.append("%s%s %s" % (name, labels, repr(float(cycle[key]))))
+        commands = cycle.get("command_times", {})
+        if commands:
+            lines.append("# HELP hemon_command_seconds Round-trip time of each ngFEC command")
+            lines.append("# TYPE hemon_command_seconds gauge")
+            for cmd in sorted(commands):
+                cmdLabels = dict(self.labels)
+                cmdLabels["cmd"] = cmd
+                lines.append("hemon_command_seconds%s %s" % (formatLabels(cmdLabels), repr(float(commands[cmd]))))
+        lines.append("# HELP hemon_last_reading_timestamp Unix time of the last reading")
+        lines.append("# TYPE hemon_last_reading_timestamp gauge")
+        lines.append("hemon_last_reading_timestamp%s %s" % (labels, repr(float(cycle["timestamp"]))))
+        # The exporter may read at any time, so replace the file in one step
+        with open(self.promFile + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.rename(self.promFile + ".tmp", self.promFile)
@@ -16,8 +16,17 @@ import sys
 from sendCommands import *
 from argparse import ArgumentParser
 from statPlot import plotHisto
+from rootWriter import RootWriter
+from binLog import appendRecord
+from dispatch import getCmdList, getCmdPattern, expandCmd, getCmdLayout, variables, defaultNames, loadVariables, \
+    getDispatch, getCmdString, makeReading, fillChannels
+from rollup import Rollup
+from onlineStats import OnlineStats, loadConfig
+from metrics import Metrics
 import re
+import json
 import time
+import itertools
 import ROOT
 from array import array
 from ROOT import TGraph, TH1D, TCanvas, TPad, gStyle, kRed, kBlue, kGreen, kCyan, kOrange, kViolet, kMagenta, TTree, TFile, TChain
@@ -45,222 +54,145 @@ gStyle.SetOptStat(0)
 #r = re.compile(r"(?<=\s)\d+\.\d+")
 r = re.compile(r"[-+]?[.]?[\d]+(?:,\d\d\d)*[\.]?\d*(?:[eE][-+]?\d+)?")
 
-# Search for results that either end in a decimal number, whitespace, or $ (eg 115.$)
-r_retry = re.compile(r"((?<=\s)\d+\.(\d+|(?=\s)|(?=\$)))")
-
-# Regex to search for total number of entries expected from an ngccm command
-# (?<=-)    positive lookbehind for -
-# \d+       at least one decimal number (0-9)
-# (?=])     positive lookahead (tailed by) ]
-r_entry = re.compile(r"(?<=-)\d+(?=])")
-
-def retrySendCmd(cmd, expectedNum, port):
-    # Using script=False works with one command and will return the raw output
-    raw = send_commands(cmds=cmd,script=False,port=port,control_hub=control_hub)
-    I = []
-    if raw[0]['result'].find("ERROR") >= 0:
-        I = [-1 for y in range(expectedNum)]
-    else:
-        #print "Raw result:"
-        #print raw[0]['result']
-        #print "regex result "
-        #print r_retry.findall(raw[0]['result'])
-        I = [float(x[0]) for x in r_retry.findall(raw[0]['result'])]
-    return I 
-
-# get command list from file
-def getCmdList(cmdFile):
-    cmdList = []
-    with open(cmdFile, 'r') as f:
-        for line in f:
-            l = line.strip()
-            if l != "": # Only consider non-empty lines
-                cmdList.append(line.strip())
-    return cmdList
-
-# get command string from command list
-def getCmdString(cmdList):
-    cmdString = ""
-    sets = ["[1-4]", "[1-64]"]
-    set_values = [4, 64]
-    joiner = "{:<40}"
-    for cmd in cmdList:
-        cmd = cmd.strip("get ")
-        cmd = cmd.strip("tget ")
-        counts = list(cmd.count(a) for a in sets)
-        # does not contain either set
-        if counts[0] == 0 and counts[1] == 0:
-            #print "no sets: {0}".format(cmd)
-            cmdString += joiner.format(cmd)
-        # contains both sets once
-        elif counts[0] == 1 and counts[1] == 1:
-            iset_1 = 0
-            iset_2 = 1
-        # contains the first set twice but not the second set
-        elif counts[0] == 2 and counts[1] == 0:
-            iset_1 = 0
-            iset_2 = 0
-        if (counts[0] == 1 and counts[1] == 1) or (counts[0] == 2 and counts[1] == 0):
-            first_split = cmd.split(sets[iset_1])
-            if len(first_split) > 2:
-                split_cmd = first_split
-            else:
-                second_split = first_split[1].split(sets[iset_2])
-                split_cmd = [first_split[0]] + second_split
-            for j in xrange(1,set_values[iset_1]+1):
-                for k in xrange(1,set_values[iset_2]+1):
-                    joined = split_cmd[0] + str(j) + split_cmd[1] + str(k) + split_cmd[2]
-                    #print "j={0} k={1} {2}".format(j,k,joined)
-                    cmdString += joiner.format(joined)
-        # contains the first set once but not the second set
-        elif counts[0] == 1 and counts[1] == 0:
-            iset = 0
-        # contains the second set once but not the first set
-        elif counts[0] == 0 and counts[1] == 1:
-            iset = 1
-        if  (counts[0] == 1 and counts[1] == 0) or (counts[0] == 0 and counts[1] == 1):
-            split_cmd = cmd.split(sets[iset])
-            for j in xrange(1,set_values[iset]+1):
-                joined = str(j).join(split_cmd)
-                #print "j={0} {1}".format(j,joined)
-                cmdString += joiner.format(joined)
-    
-    return cmdString
-
-def main():
-    parser = ArgumentParser()
-    parser.add_argument("cmds", help="text file containing list of ngFEC commands")
-    parser.add_argument("--log",  "-o", default="rbxMonitor.log", help="log file to save stats in")
-    parser.add_argument("--port", "-p", default=64000, help="port for ngccm server")
-    parser.add_argument("--rbxMon", "-r", default=False, help="Run ngfec_auto.py with rbxMon.py")
-    parser.add_argument("--runNum", "-n", default=1, help="Run Number")
-    args = parser.parse_args()
-    port = args.port
-    runRBXmon = args.rbxMon
-    run = int(args.runNum)
+# Bytes to read from ngFEC at a time (leakage current results are several kB long)
+maxread = 65536
+
+def retrySendCmds(cmds, expectedEntries, port, metrics=None):
+    # Send every command that needs another try as one script over the pooled session,
+    # adding its spawn time and bytes read to the metrics dictionary if one is given
+    retryMetrics = {}
+    results = send_commands(cmds=list(cmds),script=True,port=port,control_hub=control_hub,persistent=True,maxread=maxread,metrics=retryMetrics)
+    if metrics is not None:
+        for key, value in retryMetrics.items():
+            metrics[key] = metrics.get(key, 0) + value
+    retried = {}
+    for line in results:
+        exp = expectedEntries[line['cmd']]
+        if line['result'].find("ERROR") >= 0:
+            retried[line['cmd']] = [-1 for y in range(exp)]
+        else:
+            retried[line['cmd']] = [float(x) for x in r.findall(line['result'])]
+    return retried
+
+def takeReading(cmdList, log, port, run=1, writer=None, binLog=None, stats=None, metrics=None, variableList=None, reading=None, rollup=None):
+    """
+    Reads the commands in cmdList once, appends the values to the text
+    log, to the binary log binLog if one is given and, if a RootWriter is
+    given, to its tree. If an OnlineStats is given the reading is
+    checked for alarms and added to its running statistics. If a Metrics
+    is given the timing of each step is emitted to it. variableList
+    (see loadVariables) defaults to the module's variables. Pass the
+    same Reading (see makeReading) on every call to reuse its buffer.
+    If a Rollup is given the reading is added to its aggregates.
+    Returns the Reading. Used by main() and, in-process, by rbxMon.
+    """
     #run_time = datetime.now().strftime('%Y%m%d%H%M%S')
     run_time = float(time.time())
-    
-    #Make temp tree and branches
-    tfile = TFile('temp.root', 'recreate')
-    tree = TTree('t1', 't1')
-    run_array = array( 'i', [ 0 ] )
-    run_time_array = array( 'f', [ 0.0 ] )
-    tree.Branch("Run", run_array, "run_array/I")
-    tree.Branch("Time", run_time_array, "run_time_array/F")
-    run_array[0] = run
-    run_time_array[0] = run_time
-
-    cmdList = getCmdList(args.cmds)
+    cycle = {"timestamp": run_time}
+
+    # Which variable and channels each command fills, and how many values to expect
+    # Pexpect likes to truncate results..
+    dispatch = getDispatch(cmdList, variableList)
+    table = dispatch["table"]
+    if reading is None:
+        reading = makeReading(cmdList, variableList)
+    reading.clear()
+    reading.run[0] = run
+    reading.time[0] = run_time
+    reading.timestamp = run_time
+
     #simpleCmdString = " ".join(cmdList)
     #fullCmdString = getCmdString(cmdList)
     #print simpleCmdString
     #print fullCmdString
 
-    results = send_commands(cmds=cmdList,script=True,port=port,control_hub=control_hub)
-    params = {}
-    params["temps"] = []
-    params["hums"] = []
-    params["peltV"] = []
-    params["peltI"] = []
-    params["BVin"] = []
-    params["Vin"] = []
-    params["leakI"] = []
-    params["cardT"] = []
-    params["calibT"] = []
-    params["setV"] = []
-    params["targetT"] = []
-    names = {}
-    names["temps"] = "rtdtemperature"
-    names["hums"] = "humidity"
-    names["peltV"] = "PeltierVoltage"
-    names["peltI"] = "PeltierCurrent"
-    names["BVin"] = "-BVin"
-    names["Vin"] = "-Vin"
-    names["leakI"] = "LeakageCurrent"
-    names["cardT"] = "[1-4]-B_SHT_temp"
-    names["calibT"] = "calib-B_SHT_temp"
-    names["setV"] = "SetPeltierVoltage"
-    names["targetT"] = "targettemperature"
-    expectedEntries = {}    # Expected number of entries for each command
-
-    # Determine how many entries to expect from each command to know if it needs to be run again
-    # Pexpect likes to truncate results..
-    for c in cmdList:
-        entries = 1
-        parsedCmd = r_entry.findall(c)
-        for x in parsedCmd:
-            entries *= int(x)
-        expectedEntries[c] = entries
-
-    #for a in expectedEntries.keys():
-    #    print a, "\t", expectedEntries[a]
+    results = send_commands(cmds=cmdList,script=True,port=port,control_hub=control_hub,persistent=True,maxread=maxread,metrics=cycle)
+    cycle["command_times"] = dict((line['cmd'], line['times'][1] - line['times'][0]) for line in results)
 
     timeDate = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     #print "-------------------------------------"
     #print "| ngFEC output:\t%s |" % timeDate 
     #print "-------------------------------------"
+    parse_start = time.time()
+    retryCmds = []      # Commands whose results came back short
     for line in results:
-        # Extracts all the float values from a command output into a list
-
-        for key in params:
-            if line['cmd'].find(names[key]) >= 0:
-                exp = expectedEntries[line['cmd']]
-                if line['result'].find("ERROR") >= 0:
-                    params[key] = [-1 for y in range(exp)]
-                else:
-                    values = [float(x) for x in r.findall(line['result'])]
-                    params[key] = values
-                    name = names[key]
-                    if len(values) != exp:
-                        #print "{0}: {1} expected number: {2}".format(name, len(values), exp)
-                        values = retrySendCmd(line['cmd'], exp, port)
-                        params[key] = values
-                        #print "After retrying {0}:".format(name)
-
-    with open(args.log, "a+") as f:
-        f.write("%s " % timeDate)
-        array_dict = {}
-        x = ""
-        for key in params:
-            array_dict[key] = array('f', len(params[key]) * [0.])
-            split_name = names[key].split('-')
-            if split_name[0] == "calib":
-                name = "calib_card_" + split_name[1]
-            elif split_name[0] == "[1":
-                name = "qie_card_" + split_name[-1]
-            else:
-                name = names[key].split('-')[-1]
-            float_name = '{0}[{1}]/F'.format(name,len(params[key]))
-            #print "key: {0}, GetEntry(0): {1}".format(key,tree.GetEntry(0))            
-            tree.Branch(name, array_dict[key], float_name)
-            s = ""
-            for i, value in enumerate(params[key]):
-                #if(key=="temps"): print "{0} i={1} v={2}".format(float_name, i, value)
-                array_dict[key][i] = value
-                s += "{0} ".format(value)
-            #print "{0}: {1}".format(name, s)
-            x += s
-        f.write(x + "\n")
-
-    tree.Fill()
-    tfile.Write()
-    tfile.Close()
-    
-    if(os.path.exists("power_test_{0}.root".format(run-1))):
-        #print "it exist"
-        chain = TChain("t1")
-        chain.Add("power_test_{0}.root".format(run-1))
-        chain.Add("temp.root")
-        chain.Merge("power_test_{0}.root".format(run))
-    
-        os.remove("temp.root")
-        os.remove("power_test_{0}.root".format(run-1))
-    else:
-        chain = TChain("t1")
-        chain.Add("temp.root")
-        chain.Merge("power_test_1.root")        
-        os.remove("temp.root")
+        # Extracts all the float values from a command output into the command's channels
+        if line['cmd'] not in table:
+            continue
+        if line['result'].find("ERROR") >= 0:
+            continue    # Channels stay at -1
+        values = [float(x) for x in r.findall(line['result'])]
+        if len(values) != table[line['cmd']][2]:
+            #print "{0}: {1} expected number: {2}".format(line['cmd'], len(values), table[line['cmd']][2])
+            retryCmds.append(line['cmd'])
+        fillChannels(reading, table[line['cmd']], values)
+    cycle["parse_time"] = time.time() - parse_start
+
+    # Retry all short results together
+    nRetries = len(retryCmds)
+    if retryCmds:
+        expectedEntries = dict((cmd, table[cmd][2]) for cmd in retryCmds)
+        retried = retrySendCmds(retryCmds, expectedEntries, port, cycle)
+        for cmd in retryCmds:
+            fillChannels(reading, table[cmd], retried[cmd])
+    reading.retries[0] = nRetries
+    cycle["retries"] = nRetries
+    #print "Retried {0} commands".format(nRetries)
+
+    if stats is not None:
+        stats.update(reading, timeDate)
+
+    log_start = time.time()
+    with open(log, "a+") as f:
+        # Only the default variables, which come first, go to the text log
+        reading.writeText(f, timeDate, sum(n for key, n in reading.layout if key in defaultNames))
+
+    if binLog is not None:
+        appendRecord(binLog, run_time, reading.layout, reading.buffer)
+    if rollup is not None:
+        rollup.add(run_time, reading)
+    cycle["log_time"] = time.time() - log_start
+
+    # Append this reading to the newest power_test_part*.root file
+    root_start = time.time()
+    if writer is not None:
+        writer.fill(reading.branches(dispatch["branches"]))
+    cycle["root_time"] = time.time() - root_start
+
+    cycle["cycle_time"] = time.time() - run_time
+    if metrics is not None:
+        metrics.emit(cycle)
+    return reading
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("cmds", help="text file containing list of ngFEC commands")
+    parser.add_argument("--log",  "-o", default="rbxMonitor.log", help="log file to save stats in")
+    parser.add_argument("--port", "-p", default=64000, help="port for ngccm server")
+    parser.add_argument("--rbxMon", "-r", default=False, help="Run ngfec_auto.py with rbxMon.py")
+    parser.add_argument("--runNum", "-n", default=1, help="Run Number")
+    parser.add_argument("--root",   "-t", default="power_test", help="prefix of the ROOT files to append readings to")
+    parser.add_argument("--chunk",  "-k", default=4320, help="readings per ROOT file")
+    parser.add_argument("--bin",    "-b", default=None, help="binary log file to also save stats in")
+    parser.add_argument("--stats",  "-a", default=None, help="checkpoint file of running statistics (enables alarms)")
+    parser.add_argument("--alarmConfig", default=None, help="JSON file of alarm thresholds")
+    parser.add_argument("--alarmLog", default="alarms.log", help="log file to save alarms in")
+    parser.add_argument("--rollup",  default=None, help="prefix of min/mean/max rollup files to update")
+    parser.add_argument("--vars",    default=None, help="JSON file declaring extra variables to read (binary log and ROOT only)")
+    parser.add_argument("--metrics", default=None, help="JSON lines file to append timing metrics to")
+    parser.add_argument("--prom",    default=None, help="Prometheus text file to write timing metrics to")
+    args = parser.parse_args()
+    runRBXmon = args.rbxMon
+    writer = RootWriter(args.root, chunkSize=int(args.chunk))
+    stats = None
+    if args.stats:
+        stats = OnlineStats(args.stats, loadConfig(args.alarmConfig), args.alarmLog)
+    metrics = None
+    if args.metrics or args.prom:
+        metrics = Metrics(args.metrics, args.prom, {"hub": control_hub, "port": args.port, "log": args.log})
+    takeReading(getCmdList(args.cmds), args.log, args.port, int(args.runNum), writer, args.bin, stats, metrics, loadVariables(args.vars),
+                rollup=Rollup(args.rollup) if args.rollup else None)
+    writer.close()
 
     #if(runRBXmon==False):print "Made the Trees"
     #else:print "Made Trees with rbxMon.py"
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#######################################################################
+#  onlineStats.py                                                     #
+#                                                                     #
+#  Checks every reading as it arrives. Keeps a running mean and       #
+#  variance for each channel of each variable (Welford's algorithm)   #
+#  and raises an alarm when a new value                               #
+#                                                                     #
+#  - is below "min" or above "max" for its variable, or               #
+#  - is more than "z" standard deviations from its channel's mean     #
+#                                                                     #
+#  Channels that were not read or returned an ERROR (logged as -1)    #
+#  are left out of the checks and the statistics and raise one        #
+#  "missing" alarm per variable instead (set "missing": false to      #
+#  turn it off for a variable).                                       #
+#                                                                     #
+#  Alarms are appended to an alarm log. The running statistics are    #
+#  saved to a small JSON checkpoint after every reading so they       #
+#  survive restarts. Thresholds are read from a JSON config, e.g.     #
+#                                                                     #
+#  {"default": {"z": 5}, "hums": {"max": 10.0}, "leakI": {"z": 8}}    #
+#                                                                     #
+#######################################################################
+
+import os
+import json
+import math
+from datetime import datetime
+from reading import missing
+
+# Used for variables that are not in the config
+defaults = {"z": 5.0, "warmup": 10, "missing": True}
+
+def isMissing(value):
+    # Not read, ERROR, or NaN
+    return value == missing or value != value
+
+def loadConfig(configFile):
+    if configFile is None:
+        return {}
+    with open(configFile, "r") as f:
+        return json.load(f)
+
+class OnlineStats(object):
+    """
+    Running per-channel statistics with threshold and z-score alarms.
+    The z-score test only starts once a channel has warmup entries.
+    """
+    def __init__(self, checkpoint = "online_stats.json", config = None, alarmLog = "alarms.log"):
+        self.checkpoint = checkpoint
+        self.config = config if config is not None else {}
+        self.alarmLog = alarmLog
+        self.stats = {}     # variable: {"n": [...], "mean": [...], "m2": [...]}, one entry per channel
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.checkpoint, "r") as f:
+                self.stats = json.load(f)
+        except (IOError, ValueError):
+            self.stats = {}
+
+    def save(self):
+        # Write a new file and rename it so a crash never leaves half a checkpoint
+        with open(self.checkpoint + ".tmp", "w") as f:
+            json.dump(self.stats, f)
+        os.rename(self.checkpoint + ".tmp", self.checkpoint)
+
+    def limits(self, v):
+        limits = dict(defaults)
+        limits.update(self.config.get("default", {}))
+        limits.update(self.config.get(v, {}))
+        return limits
+
+    def check(self, v, values):
+        """
+        Returns a list of alarm messages for the values of variable v
+        """
+        alarms = []
+        limits = self.limits(v)
+        stats = self.stats.get(v)
+        absent = [i for i, value in enumerate(values) if isMissing(value)]
+        if absent and limits["missing"]:
+            shown = ", ".join(str(i) for i in absent[:16]) + (", ..." if len(absent) > 16 else "")
+            alarms.append("%s: %d of %d channels missing or ERROR (%s)" % (v, len(absent), len(values), shown))
+        for i, value in enumerate(values):
+            if isMissing(value):
+                continue
+            if "min" in limits and value < limits["min"]:
+                alarms.append("%s[%d] = %g below min %g" % (v, i, value, limits["min"]))
+            if "max" in limits and value > limits["max"]:
+                alarms.append("%s[%d] = %g above max %g" % (v, i, value, limits["max"]))
+            if stats is None or i >= len(stats["n"]) or stats["n"][i] < limits["warmup"]:
+                continue
+            sigma = math.sqrt(stats["m2"][i] / (stats["n"][i] - 1))
+            if sigma > 0:
+                z = (value - stats["mean"][i]) / sigma
+                if abs(z) > limits["z"]:
+                    alarms.append("%s[%d] = %g is %.1f sigma from mean %g" % (v, i, value, z, stats["mean"][i]))
+        return alarms
+
+    def add(self, v, values):
+        # Welford's update of the running mean and sum of squared deviations
+        stats = self.stats.setdefault(v, {"n": [], "mean": [], "m2": []})
+        for key in stats:
+            stats[key].extend([0] * (len(values) - len(stats[key])))
+        for i, value in enumerate(values):
+            if isMissing(value):
+                continue
+            value = float(value)
+            stats["n"][i] += 1
+            delta = value - stats["mean"][i]
+            stats["mean"][i] += delta / stats["n"][i]
+            stats["m2"][i] += delta * (value - stats["mean"][i])
+
+    def update(self, params, timeDate = None):
+        """
+        Checks a reading (a dictionary of lists of values, as filled by
+        ngfec_auto) against the running statistics, logs any alarms,
+        then adds it to the statistics. Returns the alarm messages.
+        """
+        if timeDate is None:
+            timeDate = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        alarms = []
+        for v in sorted(params):
+            alarms += self.check(v, params[v])
+            self.add(v, params[v])
+        if alarms:
+            with open(self.alarmLog, "a") as f:
+                for alarm in alarms:
+                    f.write("%s %s\n" % (timeDate, alarm))
+        self.save()
+        return alarms
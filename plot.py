@@ -1,96 +1,131 @@
 # plot temperature and humidity
 
+import matplotlib
+matplotlib.use("Agg")   # GIF frames are rendered off screen
 import matplotlib.pyplot as plt
 import numpy as np
 import imageio
+from query import query
+from snapshots import loadSnapshots
+
+def snapshotKind(filename):
+  # e.g. "humidity-5-JUL-2017" -> "humidity"
+  return filename.split("-")[0]
+
+def readValues(filename, snapshots=None):
+  # values of one measurements/ snapshot, one per readout module (NaN if missing), from the cached matrix
+  if snapshots is None:
+    snapshots = loadSnapshots(snapshotKind(filename))
+  row = list(snapshots["names"]).index(filename)
+  return snapshots["values"][row]
 
 def plot(filename,unit,plot_directory):
-  data_directory = "measurements/"
-  
-  values = []
-  num_rm = 0
-  with open(data_directory+filename+'.txt','r') as data:
-    for line in data:
-      parsed = line.split(" ")
-      if parsed[0] == "#":  continue
-      #print parsed
-      val = float((parsed[-1].split("\n"))[0])
-      values.append(val)
-      num_rm += 1
-  
-  mean = np.round(np.mean(values), 3)
-  std  = np.round(np.std(values), 3)
+  plotValues(readValues(filename), filename, unit, plot_directory)
+
+def plotLog(log, variable, start, stop, unit, plot_directory, name=None):
+  # plot the mean of each channel of a monitoring log variable between two times (see query.py)
+  times, values = query(log, start, stop, [variable])
+  if len(times) == 0:
+    print "No entries in %s between %s and %s" % (log, start, stop)
+    return
+  if name is None:
+    name = "%s_%s" % (variable, str(start).replace(" ", "_").replace(":", ""))
+  plotValues(list(np.nanmean(values[variable], axis=0)), name, unit, plot_directory)
 
+def getRange(unit):
   vmin, vmax = 0.0, 100.0
   if "Temperature" in unit:
     vmin, vmax = 0.0, 50.0 # deg C
   elif "Humidity" in unit:
     vmin, vmax = 0.0, 10.0 # percent
+  return vmin, vmax
 
-  fig = plt.figure()
-  
+def getStats(values):
+  # mean and std of the modules that have a value
+  values = np.asarray(values, dtype=float)
+  values = values[np.isfinite(values)]
+  return values, np.round(np.mean(values), 3), np.round(np.std(values), 3)
+
+def drawLine(ax, values, filename, unit):
   # line graph (value vs readout modudle)
-  plt.plot(values)
+  num_rm = len(values)
+  found, mean, std = getStats(values)
+  vmin, vmax = getRange(unit)
+  ax.plot(values)
   if "Temperature" in unit:
-    plt.text(10, 45, filename)
-    plt.text(40, 45, r'$\mu='+str(mean)+',\ \sigma='+str(std)+'$')
+    ax.text(10, 45, filename)
+    ax.text(40, 45, r'$\mu='+str(mean)+',\ \sigma='+str(std)+'$')
   if "Humidity" in unit:
-    plt.text(10, 9, filename)
-    plt.text(40, 9, r'$\mu='+str(mean)+',\ \sigma='+str(std)+'$')
-  plt.axis([0,num_rm,vmin,vmax])
-  plt.ylabel(unit)
-  plt.xlabel("Readout Module")
-  plt.title("Monitoring "+unit)
-  plt.grid(True)
-  #plt.show()
-  fig.savefig(plot_directory+filename+"_1.png")
-  plt.clf()
-  
+    ax.text(10, 9, filename)
+    ax.text(40, 9, r'$\mu='+str(mean)+',\ \sigma='+str(std)+'$')
+  ax.axis([0,num_rm,vmin,vmax])
+  ax.set_ylabel(unit)
+  ax.set_xlabel("Readout Module")
+  ax.set_title("Monitoring "+unit)
+  ax.grid(True)
+
+def drawHist(ax, values, filename, unit):
   # histogram (count vs value)
-  n, bins, patches = plt.hist(values, 20, facecolor='g', alpha=0.75)
+  found, mean, std = getStats(values)
+  vmin, vmax = getRange(unit)
+  n, bins, patches = ax.hist(found, 20, facecolor='g', alpha=0.75)
   if "Temperature" in unit:
-    plt.text(2, 18, filename)
-    plt.text(20, 18, r'$\mu='+str(mean)+',\ \sigma='+str(std)+'$')
+    ax.text(2, 18, filename)
+    ax.text(20, 18, r'$\mu='+str(mean)+',\ \sigma='+str(std)+'$')
   if "Humidity" in unit:
-    plt.text(2, 18, filename)
-    plt.text(6, 18, r'$\mu='+str(mean)+',\ \sigma='+str(std)+'$')
-  plt.axis([vmin,vmax,0,20])
-  plt.ylabel("Number of Readout Modules")
-  plt.xlabel(unit)
-  plt.title("Monitoring "+unit)
-  plt.grid(True)
-  #plt.show()
-  fig.savefig(plot_directory+filename+"_2.png")
-  plt.clf()
-
-  plt.close('all')
+    ax.text(2, 18, filename)
+    ax.text(6, 18, r'$\mu='+str(mean)+',\ \sigma='+str(std)+'$')
+  ax.axis([vmin,vmax,0,20])
+  ax.set_ylabel("Number of Readout Modules")
+  ax.set_xlabel(unit)
+  ax.set_title("Monitoring "+unit)
+  ax.grid(True)
 
-def makeGif(filenames, gifname, unit):
-  plot_directory = "images/"
+# drawing function for each kind of plot, numbered like the output files
+drawings = {1: drawLine, 2: drawHist}
+
+def plotValues(values, filename, unit, plot_directory):
+  fig = plt.figure()
   for append in [1,2]:
-    with imageio.get_writer(gifname+'_'+str(append)+'.gif', mode='I',duration=1) as writer:
-      for filename in filenames:
-        plot(filename, unit, plot_directory)
-        image = imageio.imread(plot_directory+filename+"_"+str(append)+".png")
-        writer.append_data(image)
-
-def getFiles(file_set):
-  file_list = []
-  with open(file_set,'r') as files:
-    for f in files:
-      line = f.split('\n')[0]
-      file_list.append(line)
-      print line
-    return file_list
+    drawings[append](fig.gca(), values, filename, unit)
+    #plt.show()
+    fig.savefig(plot_directory+filename+"_"+str(append)+".png")
+    fig.clf()
+  plt.close(fig)
+
+def renderFrame(fig, draw, values, filename, unit):
+  # draw a plot on the reused figure and return it as an RGB array
+  fig.clf()
+  draw(fig.gca(), values, filename, unit)
+  fig.canvas.draw()
+  width, height = fig.canvas.get_width_height()
+  rgba = np.frombuffer(fig.canvas.buffer_rgba(), dtype=np.uint8).reshape(height, width, 4)
+  return rgba[:, :, :3]
+
+def makeGif(filenames, gifname, unit):
+  # values come from the snapshot matrix and both GIFs are built from one figure, frame by frame in memory
+  snapshots = dict((kind, loadSnapshots(kind)) for kind in set(snapshotKind(f) for f in filenames))
+  fig = plt.figure()
+  writers = dict((append, imageio.get_writer(gifname+'_'+str(append)+'.gif', mode='I',duration=1)) for append in [1,2])
+  try:
+    for filename in filenames:
+      values = readValues(filename, snapshots[snapshotKind(filename)])
+      for append in [1,2]:
+        writers[append].append_data(renderFrame(fig, drawings[append], values, filename, unit))
+  finally:
+    for writer in writers.values():
+      writer.close()
+    plt.close(fig)
 
 if __name__ == "__main__":
   #plot("humidity-5-JUL-2017","Relative Humidity")
   #plot("temperature-5-JUL-2017","Temperature deg C")
   
-  files = getFiles("humidity_files.txt")
+  # every snapshot in measurements/, by date
+  files = list(loadSnapshots("humidity")["names"])
   makeGif(files,"humidity","Relative Humidity")
   
-  files = getFiles("temperature_files.txt")
+  files = list(loadSnapshots("temperature")["names"])
   makeGif(files,"temperature","Temperature deg C")
 
 
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+#######################################################################
+#  query.py                                                           #
+#                                                                     #
+#  Selects monitoring history by time instead of by line number:      #
+#                                                                     #
+#  times, values = query("rbx.log", "2017-07-04 02:00",               #
+#                        "2017-07-04 04:00", ["hums"], {"hums": [2]}) #
+#                                                                     #
+#  gives the humidity of RM 3 between 02:00 and 04:00 as NumPy        #
+#  arrays. Text logs get a sparse sidecar index (<log>.tidx) with the #
+#  time and byte offset of every STRIDE-th line, extended with only   #
+#  the lines appended since the last query, so a query reads only the #
+#  lines in its range. Binary logs (binLog.py) have fixed-width       #
+#  records and are searched in place. Both use binary search.         #
+#                                                                     #
+#######################################################################
+
+import os
+import time
+from datetime import datetime
+import numpy as np
+from binLog import isBinLog, loadBinLog
+from reading import missing
+
+# Lines between entries of the sparse time index
+STRIDE = 256
+
+# Variables of an ngfec_auto text log, in the order they are logged
+logVariables = ["temps", "hums", "peltV", "peltI", "BVin", "Vin", "leakI", "cardT", "calibT", "setV", "targetT"]
+
+# Sparse time index records: time of a line (seconds since epoch) and its byte offset
+indexDtype = np.dtype([("time", "<f8"), ("offset", "<i8")])
+
+# Number of values each variable takes up in a text log line, in column order.
+# HE has 48 channels per RM
+# HB has 64 channels per RM
+def getLayout(variables, nRMs=4, nRMchs=64):
+    layout = []
+    for v in variables:
+        if v == "leakI":
+            layout.append((v, nRMs * nRMchs))
+        elif v in ["cardT"]:
+            layout.append((v, 4 * nRMs))
+        elif v in ["calibT"]:
+            layout.append((v, 1))
+        else:
+            layout.append((v, nRMs))
+    return layout
+
+def parseLines(lines, variables):
+    """
+    Parses text log lines into the readings (date and time of each
+    entry) and a dictionary of (entries x channels) arrays, one per
+    variable. Values missing from a line or logged as missing (-1, see
+    reading.py) are NaN.
+    """
+    layout = getLayout(variables)
+    nCols = sum(n for v, n in layout)
+    data = np.full((len(lines), nCols), np.nan)
+    readings = []
+    for i, line in enumerate(lines):
+        fields = line.split(None, 2)
+        readings.append({"date": fields[0], "time": fields[1]})
+        # Parse the whole line of values at once
+        row = np.fromstring(fields[2] if len(fields) > 2 else "", sep=" ")[:nCols]
+        data[i, :len(row)] = row
+    data[data == missing] = np.nan
+
+    values = {}
+    n = 0
+    for v, count in layout:
+        values[v] = data[:, n:n + count]
+        n += count
+    return readings, values
+
+def toEpoch(stamp):
+    """
+    Seconds since epoch of a datetime, a number (returned as is) or a
+    "YYYY-MM-DD HH:MM[:SS]" string in local time, as ngfec_auto logs it
+    """
+    if stamp is None:
+        return None
+    if isinstance(stamp, (int, long, float)):
+        return float(stamp)
+    if isinstance(stamp, datetime):
+        return time.mktime(stamp.timetuple()) + stamp.microsecond * 1e-6
+    stamp = stamp.strip()
+    for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']:
+        try:
+            return time.mktime(time.strptime(stamp, fmt))
+        except ValueError:
+            pass
+    raise ValueError("Unrecognised time: %r" % stamp)
+
+# Seconds since epoch of the start of each hour seen in a log, keyed by "YYYY-MM-DD HH"
+hourStarts = {}
+
+def lineTime(line):
+    # Time of a text log line, which starts with "YYYY-MM-DD HH:MM:SS"
+    hour = line[:13]
+    if hour not in hourStarts:
+        hourStarts[hour] = time.mktime(time.strptime(hour, '%Y-%m-%d %H'))
+    return hourStarts[hour] + int(line[14:16]) * 60 + int(line[17:19])
+
+def timeIndexName(path):
+    return path + ".tidx"
+
+def timeIndex(path, stride=STRIDE):
+    """
+    Returns the sparse time index of a text log (the time and byte
+    offset of every stride-th line), adding the lines appended since
+    it was last updated
+    """
+    index = timeIndexName(path)
+    entries = np.zeros(0, dtype=indexDtype)
+    if os.path.exists(index):
+        entries = np.fromfile(index, dtype=indexDtype)
+    # Rebuild if the log shrank
+    if len(entries) and entries["offset"][-1] >= os.path.getsize(path):
+        entries = np.zeros(0, dtype=indexDtype)
+        os.remove(index)
+    added = []
+    with open(path, "rb") as f:
+        # Count lines on from the last indexed one, which is already in the index
+        offset = entries["offset"][-1] if len(entries) else 0
+        f.seek(offset)
+        for nLine, line in enumerate(f):
+            if not line.endswith("\n"):
+                break # Leave a partially written line for next time
+            if nLine % stride == 0 and not (nLine == 0 and len(entries)):
+                added.append((lineTime(line), offset))
+            offset += len(line)
+    if added:
+        added = np.array(added, dtype=indexDtype)
+        with open(index, "ab") as f:
+            added.tofile(f)
+        entries = np.concatenate([entries, added])
+    return entries
+
+def selectChannels(values, channels):
+    # channels is a list of channel numbers (from 0) for every variable or a dict of them by variable
+    if channels is None:
+        return values
+    selected = {}
+    for v in values:
+        chs = channels.get(v) if isinstance(channels, dict) else channels
+        selected[v] = values[v] if chs is None else values[v][:, chs]
+    return selected
+
+def queryText(log, start, stop, variables, channels=None):
+    entries = timeIndex(log)
+    # Read from the index entry before start to the one after stop
+    lo = np.searchsorted(entries["time"], start, "right") - 1 if start is not None else -1
+    hi = np.searchsorted(entries["time"], stop, "left") if stop is not None else len(entries)
+    first = entries["offset"][lo] if lo >= 0 else 0
+    with open(log, "rb") as f:
+        f.seek(first)
+        if hi < len(entries):
+            data = f.read(entries["offset"][hi] - first)
+        else:
+            data = f.read()
+            data = data[:data.rfind("\n") + 1]
+    lines = data.splitlines()
+    times = np.array([lineTime(line) for line in lines], dtype=np.float64)
+    keep = np.ones(len(lines), dtype=bool)
+    if start is not None:
+        keep &= times >= start
+    if stop is not None:
+        keep &= times < stop
+    # The columns of a text log are always the full logVariables layout
+    readings, values = parseLines([line for line, k in zip(lines, keep) if k], logVariables)
+    return times[keep], selectChannels(dict((v, values[v]) for v in variables), channels)
+
+def queryBin(log, start, stop, variables, channels=None):
+    schema, records = loadBinLog(log)
+    times = records["time"]
+    i0 = np.searchsorted(times, start, "left") if start is not None else 0
+    i1 = np.searchsorted(times, stop, "left") if stop is not None else len(records)
+    records = records[i0:i1]
+    names = [v for v, n in schema]
+    values = {}
+    for v in variables:
+        if v in names:
+            values[v] = np.asarray(records[v], dtype=np.float64)
+            values[v][values[v] == missing] = np.nan
+        else:
+            values[v] = np.full((len(records), 0), np.nan)
+    return np.asarray(records["time"], dtype=np.float64), selectChannels(values, channels)
+
+def query(log, start=None, stop=None, variables=None, channels=None):
+    """
+    Returns (times, values) for the entries of a text or binary log with
+    start <= time < stop (either can be None for no limit; see toEpoch
+    for the formats accepted). times is an array of seconds since epoch
+    and values a dictionary of (entries x channels) arrays. channels
+    selects channel numbers (from 0), for every variable or by variable.
+    """
+    if variables is None:
+        variables = logVariables
+    start, stop = toEpoch(start), toEpoch(stop)
+    if isBinLog(log):
+        return queryBin(log, start, stop, variables, channels)
+    return queryText(log, start, stop, variables, channels)
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument("log", help="text or binary log from ngfec_auto")
+    parser.add_argument("--start", "-s", default=None, help="first time, e.g. \"2017-07-04 02:00\"")
+    parser.add_argument("--stop",  "-e", default=None, help="time to stop before")
+    parser.add_argument("--var",   "-v", default="hums", help="variable to print")
+    parser.add_argument("--channels", "-c", default=None, help="channel numbers (from 0), comma separated")
+    args = parser.parse_args()
+    channels = list(int(c) for c in args.channels.split(",")) if args.channels else None
+    times, values = query(args.log, args.start, args.stop, [args.var], channels)
+    for t, row in zip(times, values[args.var]):
+        print datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S'), " ".join("%g" % x for x in row)
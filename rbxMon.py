@@ -1,18 +1,16 @@
 #!/usr/bin/python
 from sendCommands import *
 from argparse import ArgumentParser
-from ngfec_auto import getCmdList, getCmdString
+from ngfec_auto import getCmdList, getCmdString, takeReading, makeReading
+from rootWriter import RootWriter
+from onlineStats import OnlineStats
+from metrics import Metrics
+from rollup import Rollup
+from scheduling import writeLog, schedule
 from ROOT import TTree, TFile
 from array import array
 
-def writeLog(message, logFile, verbose=1):
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    message = now + " " + message
-    logFile.write(message + "\n")
-    if verbose:
-        print message
-
-def peltier(steptime, intervaltime, testType):
+def peltier(steptime, intervaltime, testType, policy="skip"):
     print "Step time: {0}".format(steptime)
     print "Interval time: {0}".format(intervaltime)
     cmdList1 = []
@@ -57,6 +55,11 @@ def peltier(steptime, intervaltime, testType):
     readCmdFile = "HBcommandList.txt"
     readCmdList = getCmdList(readCmdFile)
     readCmdString = getCmdString(readCmdList)
+    reading = makeReading(readCmdList)     # Reused by every takeReading
+    rollup = Rollup("%s_rollup" % dataLog.split(".")[0])
+    writer = RootWriter()
+    stats = OnlineStats("%s.stats.json" % dataLog, alarmLog="%s_alarms.log" % dataLog.split(".")[0])
+    metrics = Metrics("%s.metrics.jsonl" % dataLog.split(".")[0], labels={"hub": control_hub, "port": port, "log": dataLog})
 
     #################################################
     #Makeing Run Tree
@@ -69,29 +72,32 @@ def peltier(steptime, intervaltime, testType):
     #with open(dataLog, 'a') as f:
     #    writeLog(readCmdString, f, 0)
     # loop through actions
-    for i, action in enumerate(actions):
-        with open(actionLog, 'a') as f:
-            writeLog(action, f)
-            if cmdLists:
-                results = send_commands(cmds=cmdLists[i],script=False,port=port,control_hub=control_hub)
-                print results
-        t = 0
-        while t < intervaltime:
-            runNum = (t/steptime)+1
-            print "Processing Run  {0}".format(runNum)
-            #################################################
-            #runArray[0] = runNum
-            #print runArray[0]
-            #print tree.GetEntry(0)
-            #if(tree.GetEntry(0)==0): tree.Branch('run', runArray, 'runArray/I') #Need a better way to check if branch exist
-            #tree.Fill()
-            os.system("./ngfec_auto.py %s -o %s -p %d -r True -n %d" % (readCmdFile, dataLog, port, runNum))
-            t += steptime
-            if t < intervaltime: sleep(steptime) # don't sleep on the final iteration
-
-    #tfile.Write()
-    #tfile.Close()
-    #################################################
+    try:
+        for i, action in enumerate(actions):
+            with open(actionLog, 'a') as f:
+                writeLog(action, f)
+                if cmdLists:
+                    results = send_commands(cmds=cmdLists[i],script=False,port=port,control_hub=control_hub,persistent=True)
+                    print results
+            for runNum in schedule(steptime, intervaltime, policy, actionLog):
+                print "Processing Run  {0}".format(runNum)
+                #################################################
+                #runArray[0] = runNum
+                #print runArray[0]
+                #print tree.GetEntry(0)
+                #if(tree.GetEntry(0)==0): tree.Branch('run', runArray, 'runArray/I') #Need a better way to check if branch exist
+                #tree.Fill()
+                try:
+                    takeReading(readCmdList, dataLog, port, runNum, writer, stats=stats, metrics=metrics, reading=reading, rollup=rollup)
+                except Exception as e:
+                    # Lose this reading only; the session is reconnected on the next one
+                    with open(actionLog, 'a') as f:
+                        writeLog("Reading %d failed: %s" % (runNum, e), f)
+    finally:
+        #tfile.Write()
+        #tfile.Close()
+        #################################################
+        writer.close()
     with open(actionLog, 'a') as f:
         writeLog("Finishing %s" % testName, f)
 
@@ -102,6 +108,7 @@ def runPeltier():
     parser.add_argument("--test",     "-t", default="monitor", help="test type (can be disable, set, scan, or monitor)")
     parser.add_argument("--current",  "-c", default=-1.0,      help="current from power supply")
     parser.add_argument("--voltage",  "-v", default=-1.0,      help="voltage from power supply")
+    parser.add_argument("--policy",   "-p", default="skip",    help="what to do with steps missed by a slow reading (skip or compress)")
     args = parser.parse_args()
     steptime = int(args.step)
     intervaltime = int(args.interval)
@@ -112,38 +119,64 @@ def runPeltier():
         print "Please provide both -c current and -v voltage from the power supply."
         return
     elif current == -1.0 and voltage == -1.0:
-        peltier(steptime, intervaltime, testType)
+        peltier(steptime, intervaltime, testType, str(args.policy))
     else:
         with open ("power_supply.log", 'a') as f:
             writeLog("%f %f" % (voltage, current), f)
 
+# ngccm server port of each subdetector
+ports = {"HE": 64100, "HB": 64400}
+
+def getTarget(rbx, control_hub="hcal904daq04"):
+    for det in ports:
+        if det in rbx:
+            return (control_hub, ports[det])
+    return (control_hub, 0)
+
 def readRM(rbx, rm):
-    nchannels = 0
-    port = 0
-    if "HE" in rbx:
-        nchannels = 48
-        port = 64100
-    elif "HB" in rbx:
-        nchannels = 64
-        port = 64400
+    control_hub, port = getTarget(rbx)
     name = "%s_RM%d" % (rbx, rm)
     dataLog = "%s_data.log" % (name)
     readLog = "%s_read.log" % (name)
     cmds = "%s.txt" % (name)
-    control_hub = "hcal904daq04"
 
     with open(readLog, 'a') as f:
         writeLog("Read %s" % name, f)
-        os.system("./ngfec_auto.py %s -o %s -p %d -r True" %(cmds, dataLog, port))
+        writer = RootWriter()
+        takeReading(getCmdList(cmds), dataLog, port, writer=writer)
+        writer.close()
+
+def readRMs(rbxs, rms, sweepLog="sweep.log", timeout=60):
+    # Read every RM of every RBX in one sweep, polling all ngccm servers in parallel
+    cmds = {}
+    for rbx in rbxs:
+        target = getTarget(rbx)
+        for rm in rms:
+            cmds.setdefault(target, []).extend(getCmdList("%s_RM%d.txt" % (rbx, rm)))
+    reading = poll_targets(cmds.keys(), cmds, timeout=timeout)
+    with open(sweepLog, 'a') as f:
+        for target in sorted(reading["results"]):
+            results = reading["results"][target]
+            if target in reading["timeouts"]:
+                writeLog("%s:%d timed out after %ds" % (target[0], target[1], timeout), f)
+            elif results is None:
+                writeLog("%s:%d failed: %s" % (target[0], target[1], reading["errors"].get(target)), f)
+            else:
+                for line in results:
+                    f.write("%s %s:%d %s # %s\n" % (reading["date"], target[0], target[1], line["cmd"], line["result"]))
+    return reading
 
 def runRead():
     parser = ArgumentParser()
-    parser.add_argument("--rbx",    "-r", default="HE0", help="RBX name (HE0, HB0)")
-    parser.add_argument("--rm",     "-s", default="1",   help="Read from this RM slot number (1-4)")
+    parser.add_argument("--rbx",    "-r", default="HE0", help="RBX name(s), comma separated (HE0, HB0)")
+    parser.add_argument("--rm",     "-s", default="1",   help="Read from these RM slot numbers, comma separated (1-4)")
     args = parser.parse_args()
-    rbx = str(args.rbx)
-    rm = int(args.rm)
-    readRM(rbx, rm)
+    rbxs = str(args.rbx).split(",")
+    rms = list(int(rm) for rm in str(args.rm).split(","))
+    if len(rbxs) == 1 and len(rms) == 1:
+        readRM(rbxs[0], rms[0])
+    else:
+        readRMs(rbxs, rms)
 
 def main():
     #tfile = TFile('power_test.root', 'recreate')
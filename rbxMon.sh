@@ -1,7 +1,12 @@
 #!/bin/bash
-ssh -T daq@cmshcaltb02 << 'END'
-pushd /home/daq/HE_Monitoring
-./ngfec_auto.py commandList.txt -o rbx.log
-./statPlot.py rbx.log -n -10
-popd
+# Better: run ./localRbxMon.sh from the crontab of cmshcaltb02 itself.
+# From elsewhere, reuse one ssh connection between runs instead of
+# setting up a new one on every tick.
+host="daq@cmshcaltb02"
+if [ "$(hostname -s)" = "cmshcaltb02" ]; then
+    /home/daq/HE_Monitoring/localRbxMon.sh
+    exit
+fi
+ssh -T -o ControlMaster=auto -o ControlPath="$HOME/.ssh/hemon-%r@%h:%p" -o ControlPersist=1h $host << 'END'
+/home/daq/HE_Monitoring/localRbxMon.sh
 END
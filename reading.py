@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#######################################################################
+#  reading.py                                                         #
+#                                                                     #
+#  Holds the values of one ngfec_auto reading in a single             #
+#  preallocated float32 buffer. Each variable is a named slice of the #
+#  buffer, so                                                         #
+#                                                                     #
+#  - parsing writes values straight into the buffer,                  #
+#  - the ROOT branches point at the same memory,                      #
+#  - the text and binary logs are written from the buffer directly,   #
+#                                                                     #
+#  and nothing is copied or reallocated between cycles. Keep one      #
+#  Reading per RBX reader and pass it to every takeReading call.      #
+#                                                                     #
+#######################################################################
+
+import numpy as np
+
+# Value logged for channels that were not read or returned an ERROR
+missing = -1
+
+class Reading(object):
+    """
+    A reading with the layout [(variable, number of values), ...].
+    reading[variable] is a numpy view onto the buffer, and iterating
+    gives the variables in layout order, so a Reading can be used
+    wherever a params dictionary of value lists was.
+    """
+    def __init__(self, layout):
+        self.layout = [(v, n) for v, n in layout]
+        self.buffer = np.empty(sum(n for v, n in self.layout), dtype=np.float32)
+        self.views = {}
+        start = 0
+        for v, n in self.layout:
+            self.views[v] = self.buffer[start:start + n]
+            start += n
+        # Single-value run branches
+        self.run = np.zeros(1, dtype=np.int32)
+        self.time = np.zeros(1, dtype=np.float32)
+        self.retries = np.zeros(1, dtype=np.int32)
+        self.timestamp = 0.0    # Full-precision time; the Time branch is only float32
+        self.cached = {}    # ROOT branch lists, keyed by the branch names used
+        self.clear()
+
+    def clear(self):
+        # Unread values are logged as missing
+        self.buffer.fill(missing)
+        self.retries[0] = 0
+
+    def __getitem__(self, v):
+        return self.views[v]
+
+    def __contains__(self, v):
+        return v in self.views
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.layout)
+
+    def keys(self):
+        return [v for v, n in self.layout]
+
+    def items(self):
+        return [(v, self.views[v]) for v, n in self.layout]
+
+    def branches(self, names):
+        """
+        Returns the (name, array, leaflist) list for RootWriter.fill. names
+        maps each variable to its branch name. The arrays are views onto
+        the buffer, so the list is built once and reused.
+        """
+        key = tuple(sorted(names.items()))
+        if key not in self.cached:
+            branches = [
+                ("Run", self.run, "run_array/I"),
+                ("Time", self.time, "run_time_array/F"),
+                ("Retries", self.retries, "retries_array/I"),
+            ]
+            for v, n in self.layout:
+                name = names[v]
+                branches.append((name, self.views[v], "{0}[{1}]/F".format(name, n)))
+            self.cached[key] = branches
+        return self.cached[key]
+
+    def writeText(self, f, timeDate, n=None):
+        # One text log line: date, time, then the first n values (all by default) in layout order
+        values = self.buffer[:n]
+        f.write("%s " % timeDate)
+        if len(values):
+            f.flush()   # tofile writes below the file object's buffer
+            values.tofile(f, sep=" ", format="%.7g")
+            f.write(" ")
+        f.write("\n")
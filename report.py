@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+#######################################################################
+#  report.py                                                          #
+#                                                                     #
+#  Trend report over all measurements/ snapshots of a kind (see       #
+#  snapshots.py), computed on the whole (date x RBX-RM) matrix at     #
+#  once:                                                              #
+#                                                                     #
+#  - per-RM mean, spread, latest value and linear trend (per day)     #
+#  - day-over-day deltas                                              #
+#  - outliers: values more than --z standard deviations from the      #
+#    mean of all RMs on the same day                                  #
+#  - the --worst RMs, ranked by their mean |z|                        #
+#                                                                     #
+#  ./report.py humidity temperature -o reports/                       #
+#                                                                     #
+#  writes <kind>_report.csv (one row per RM), <kind>_deltas.csv,      #
+#  <kind>_outliers.csv and a summary plot <kind>_report.png.          #
+#                                                                     #
+#######################################################################
+
+import os
+import sys
+import csv
+import warnings
+from argparse import ArgumentParser
+import numpy as np
+from snapshots import loadSnapshots
+
+def trends(days, values):
+    """
+    Least squares slope (per day) of every column of values against
+    days, ignoring missing (NaN) values
+    """
+    found = np.isfinite(values)
+    x = np.where(found, days[:, np.newaxis], 0.0)
+    y = np.where(found, values, 0.0)
+    n = found.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xm = x.sum(axis=0) / n
+        ym = y.sum(axis=0) / n
+        dx = np.where(found, x - xm, 0.0)
+        dy = np.where(found, y - ym, 0.0)
+        return (dx * dy).sum(axis=0) / (dx * dx).sum(axis=0)
+
+def fleetZ(values):
+    # z-score of every value relative to all RMs of the same snapshot
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=1)[:, np.newaxis]
+        std = np.nanstd(values, axis=1)[:, np.newaxis]
+        return (values - mean) / std
+
+def latest(values):
+    # last value of every column that has one
+    found = np.isfinite(values)
+    last = len(values) - 1 - np.argmax(found[::-1], axis=0)
+    result = values[last, np.arange(values.shape[1])]
+    result[~found.any(axis=0)] = np.nan
+    return result
+
+def makeReport(snapshots, z=3.0):
+    """
+    Returns a dictionary of per-RM statistics (arrays over RMs), the
+    day-over-day deltas (snapshots - 1 x RMs, per day) and the z-scores
+    """
+    values = snapshots["values"]
+    dates = snapshots["dates"]
+    days = (dates - dates[0]).astype(float) if len(dates) else np.zeros(0)
+    zs = fleetZ(values)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)     # RMs without any value give NaN
+        deltas = np.diff(values, axis=0) / np.diff(days)[:, np.newaxis]
+        absZ = np.abs(zs)
+        stats = {
+            "n": np.isfinite(values).sum(axis=0),
+            "mean": np.nanmean(values, axis=0),
+            "std": np.nanstd(values, axis=0),
+            "min": np.nanmin(values, axis=0),
+            "max": np.nanmax(values, axis=0),
+            "latest": latest(values),
+            "slope_per_day": trends(days, values),
+            "last_delta_per_day": latest(deltas) if len(deltas) else np.full(values.shape[1], np.nan),
+            "max_abs_z": np.nanmax(absZ, axis=0),
+            "mean_abs_z": np.nanmean(absZ, axis=0),
+            "outlier_days": (absZ > z).sum(axis=0),
+        }
+    # Rank 1 is the RM furthest from the rest of the fleet on average
+    order = np.argsort(-np.nan_to_num(stats["mean_abs_z"]), kind="mergesort")
+    stats["rank"] = np.empty(len(order), dtype=int)
+    stats["rank"][order] = np.arange(1, len(order) + 1)
+    return {"stats": stats, "deltas": deltas, "z": zs, "order": order}
+
+# Columns of the per-RM CSV
+columns = ["rank", "n", "mean", "std", "min", "max", "latest", "slope_per_day", "last_delta_per_day", "max_abs_z", "mean_abs_z", "outlier_days"]
+
+def fmt(value):
+    return "" if isinstance(value, float) and np.isnan(value) else "%.6g" % value
+
+def writeCSV(kind, snapshots, report, out, z=3.0):
+    channels = snapshots["channels"]
+    dates = [str(d) for d in snapshots["dates"]]
+    stats = report["stats"]
+    with open(os.path.join(out, "%s_report.csv" % kind), "wb") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rm"] + columns)
+        for i in report["order"]:
+            writer.writerow([channels[i]] + [fmt(stats[c][i].item()) for c in columns])
+    with open(os.path.join(out, "%s_deltas.csv" % kind), "wb") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date"] + list(channels))
+        for d, row in zip(dates[1:], report["deltas"]):
+            writer.writerow([d] + [fmt(x) for x in row.tolist()])
+    with open(os.path.join(out, "%s_outliers.csv" % kind), "wb") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "rm", "value", "z"])
+        with np.errstate(invalid="ignore"):
+            rows, cols = np.nonzero(np.abs(report["z"]) > z)
+        for r, c in zip(rows, cols):
+            writer.writerow([dates[r], channels[c], fmt(snapshots["values"][r, c]), fmt(report["z"][r, c])])
+
+def plotReport(kind, unit, snapshots, report, out, worst=5):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    values = snapshots["values"]
+    dates = snapshots["dates"].astype("O")
+    channels = snapshots["channels"]
+    fig, (top, bottom) = plt.subplots(2, 1, figsize=(10, 9))
+    # Fleet mean and spread, with the worst RMs on top
+    mean = np.nanmean(values, axis=1)
+    std = np.nanstd(values, axis=1)
+    top.fill_between(dates, mean - std, mean + std, color="0.8", label="all RMs (mean $\\pm\\sigma$)")
+    top.plot(dates, mean, color="k")
+    for i in report["order"][:worst]:
+        top.plot(dates, values[:, i], marker="o", label=channels[i])
+    top.set_ylabel(unit)
+    top.set_title("Monitoring %s: %d RMs, %d snapshots" % (unit, values.shape[1], values.shape[0]))
+    top.legend(loc="best", fontsize="small")
+    top.grid(True)
+    # z-score of every RM on every day
+    image = bottom.imshow(report["z"].T, aspect="auto", interpolation="nearest", cmap="RdBu_r", vmin=-4, vmax=4)
+    bottom.set_xticks(range(len(dates)))
+    bottom.set_xticklabels([d.strftime("%d %b") for d in dates], rotation=45, fontsize="small")
+    bottom.set_ylabel("Readout Module")
+    bottom.set_title("z-score relative to all RMs")
+    fig.colorbar(image, ax=bottom)
+    fig.tight_layout()
+    fig.savefig(os.path.join(out, "%s_report.png" % kind))
+    plt.close(fig)
+
+units = {"humidity": "Relative Humidity", "temperature": "Temperature deg C"}
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("kinds", nargs="*", default=["humidity", "temperature"], help="snapshot kinds to report on")
+    parser.add_argument("--dir",   "-d", default="measurements/", help="directory of the snapshots")
+    parser.add_argument("--out",   "-o", default="reports/", help="directory to save the reports in")
+    parser.add_argument("--z",     "-z", type=float, default=3.0, help="|z| above which a value is an outlier")
+    parser.add_argument("--worst", "-w", type=int, default=5, help="number of worst RMs to plot")
+    parser.add_argument("--noPlot", action="store_true", help="only write the CSV files")
+    args = parser.parse_args()
+    if not os.path.exists(args.out):
+        os.makedirs(args.out)
+    for kind in args.kinds:
+        snapshots = loadSnapshots(kind, args.dir)
+        if len(snapshots["names"]) == 0:
+            print "No %s snapshots in %s" % (kind, args.dir)
+            continue
+        report = makeReport(snapshots, args.z)
+        writeCSV(kind, snapshots, report, args.out, args.z)
+        if not args.noPlot:
+            plotReport(kind, units.get(kind, kind), snapshots, report, args.out, args.worst)
+        print "Worst %s RMs:" % kind, ", ".join(snapshots["channels"][i] for i in report["order"][:args.worst])
+
+if __name__ == "__main__":
+    sys.exit(main())
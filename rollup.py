@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+#######################################################################
+#  rollup.py                                                          #
+#                                                                     #
+#  Keeps per-channel min/mean/max aggregates of the readings at       #
+#  several resolutions (1 minute, 1 hour, 1 day) so that weeks of     #
+#  20-second readings can be plotted from a few thousand points.      #
+#                                                                     #
+#  Each resolution is a binary log (see binLog.py) named              #
+#  <prefix>_<resolution>.bin with one record per time bucket:         #
+#                                                                     #
+#  time : start of the bucket (seconds since epoch)                   #
+#  count : number of readings in the bucket                           #
+#  <variable>_min, <variable>_mean, <variable>_max : per channel      #
+#  <variable>_n : per channel, number of readings with a value        #
+#                                                                     #
+#  Missing and ERROR values (-1, see reading.py) and NaN are left out #
+#  of the aggregates; a channel without any value in a bucket has NaN #
+#  min/mean/max. ngfec_auto updates the rollups with every reading    #
+#  (--rollup PREFIX); the last record of each file is rewritten until #
+#  its bucket is over. Rollups of an existing log can be built with   #
+#                                                                     #
+#  ./rollup.py rbx.log rbx                                            #
+#                                                                     #
+#######################################################################
+
+import os
+import time
+import numpy as np
+import binLog
+from binLog import appendRecord, replaceLastRecord, loadBinLog
+from query import query, logVariables
+from reading import missing
+
+# Name and length in seconds of each resolution, finest first
+resolutions = [("1min", 60), ("1h", 3600), ("1d", 86400)]
+
+def rollupName(prefix, resolution):
+    return "%s_%s.bin" % (prefix, resolution)
+
+def rollupSchema(layout):
+    schema = [("count", 1)]
+    for v, n in layout:
+        schema += [(v + "_min", n), (v + "_mean", n), (v + "_max", n), (v + "_n", n)]
+    return schema
+
+class Rollup(object):
+    """
+    Aggregates readings (anything with a layout and a flat float32
+    buffer, see reading.py) into one bucket per resolution. Buckets
+    are aligned to multiples of their length since the epoch, so daily
+    buckets start at midnight UTC.
+    """
+    def __init__(self, prefix, resolutions = resolutions):
+        self.prefix = prefix
+        self.resolutions = resolutions
+        self.layout = None
+        self.buckets = {}   # resolution: {"start", "count", "n", "min", "sum", "max"} of the open bucket
+
+    def setLayout(self, layout):
+        # Set up the schema on the first reading and resume any open buckets
+        self.layout = [(v, n) for v, n in layout]
+        self.schema = rollupSchema(self.layout)
+        self.slices = []
+        start = 0
+        for v, n in self.layout:
+            self.slices.append(slice(start, start + n))
+            start += n
+        for name, seconds in self.resolutions:
+            path = rollupName(self.prefix, name)
+            if not os.path.exists(path):
+                continue
+            schema, records = loadBinLog(path)
+            if schema != self.schema:
+                # Read with other commands: keep the old file and start a new one
+                moved = "%s.%s" % (path, time.strftime('%Y%m%d%H%M%S'))
+                os.rename(path, moved)
+                binLog.schemas.pop(path, None)
+                print "Rollup schema changed, moved %s to %s" % (path, moved)
+                continue
+            if len(records):
+                last = records[-1]
+                n = np.concatenate([last[v + "_n"] for v, c in self.layout]).astype(np.float64)
+                mean = np.concatenate([last[v + "_mean"] for v, c in self.layout]).astype(np.float64)
+                found = n > 0
+                self.buckets[name] = {
+                    "start": float(last["time"]),
+                    "count": int(last["count"][0]),
+                    "n": n,
+                    "min": np.where(found, np.concatenate([last[v + "_min"] for v, c in self.layout]), np.inf),
+                    "sum": np.where(found, mean * n, 0.0),
+                    "max": np.where(found, np.concatenate([last[v + "_max"] for v, c in self.layout]), -np.inf),
+                }
+
+    def record(self, bucket):
+        # The float32 values of a bucket in schema order
+        found = bucket["n"] > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = bucket["sum"] / bucket["n"]
+        low = np.where(found, bucket["min"], np.nan)
+        high = np.where(found, bucket["max"], np.nan)
+        parts = [np.array([bucket["count"]])]
+        for s in self.slices:
+            parts += [low[s], mean[s], high[s], bucket["n"][s]]
+        return np.concatenate(parts).astype(np.float32)
+
+    def add(self, timestamp, reading):
+        if self.layout is None:
+            self.setLayout(reading.layout)
+        values = reading.buffer.astype(np.float64)
+        # Leave missing or ERROR channels out of the aggregates
+        found = np.isfinite(values) & (values != missing)
+        for name, seconds in self.resolutions:
+            start = timestamp - timestamp % seconds
+            bucket = self.buckets.get(name)
+            path = rollupName(self.prefix, name)
+            if bucket is not None and start < bucket["start"]:
+                continue    # Older than the open bucket; the records must stay in time order
+            if bucket is None or bucket["start"] != start:
+                n = len(values)
+                bucket = {"start": start, "count": 0, "n": np.zeros(n), "min": np.full(n, np.inf), "sum": np.zeros(n), "max": np.full(n, -np.inf)}
+                new = True
+            else:
+                new = False
+            bucket["count"] += 1
+            bucket["n"] += found
+            bucket["sum"] += np.where(found, values, 0.0)
+            np.minimum(bucket["min"], np.where(found, values, np.inf), bucket["min"])
+            np.maximum(bucket["max"], np.where(found, values, -np.inf), bucket["max"])
+            if new:
+                self.buckets[name] = bucket
+                appendRecord(path, start, self.schema, self.record(bucket))
+            else:
+                replaceLastRecord(path, start, self.record(bucket))
+
+def merge(times, values, counts, seconds, width, stat):
+    """
+    Merges consecutive buckets of length seconds into at most about
+    width buckets: the min of the mins, the max of the maxes, or the mean
+    weighted by the number of values (counts, the _n arrays). Returns
+    (times, values) with times the start of each merged bucket.
+    """
+    if len(times) <= width:
+        return times, values
+    span = times[-1] + seconds - times[0]
+    step = seconds * int(np.ceil(span / (width * seconds)))
+    groups = times // step
+    starts = np.nonzero(np.r_[True, groups[1:] != groups[:-1]])[0]
+    merged = {}
+    for v in values:
+        if stat == "min":
+            merged[v] = np.fmin.reduceat(values[v], starts, axis=0)
+        elif stat == "max":
+            merged[v] = np.fmax.reduceat(values[v], starts, axis=0)
+        else:
+            n = np.add.reduceat(counts[v], starts, axis=0)
+            sums = np.add.reduceat(np.where(counts[v] > 0, values[v] * counts[v], 0.), starts, axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                merged[v] = sums / n
+    return groups[starts] * step, merged
+
+def select(prefix, start=None, stop=None, width=1000, variables=None, stat="mean"):
+    """
+    Returns (resolution, times, values) from the coarsest rollup with at
+    least width buckets between start and stop, or the finest one if
+    none has that many. Buckets are merged (see merge) down to about
+    width points. values has the stat ("min", "mean" or "max") of each
+    variable as (buckets x channels) arrays.
+    """
+    chosen = None
+    for name, seconds in reversed(resolutions):
+        path = rollupName(prefix, name)
+        if not os.path.exists(path):
+            continue
+        chosen = name
+        length = seconds
+        times, counts = query(path, start, stop, ["count"])
+        if len(times) >= width:
+            break
+    if chosen is None:
+        raise IOError("No rollups found for %s" % prefix)
+    path = rollupName(prefix, chosen)
+    if variables is None:
+        schema, records = loadBinLog(path, 0, 0)
+        variables = [v[:-len("_mean")] for v, n in schema if v.endswith("_mean")]
+    columns = [v + "_" + stat for v in variables]
+    if stat == "mean":
+        columns += [v + "_n" for v in variables]
+    times, values = query(path, start, stop, columns)
+    counts = dict((v, values.get(v + "_n")) for v in variables)
+    times, values = merge(times, dict((v, values[v + "_" + stat]) for v in variables), counts, length, width, stat)
+    return chosen, times, values
+
+class LogReading(object):
+    # One entry of a log, shaped like a Reading for Rollup.add
+    def __init__(self, layout, buffer):
+        self.layout = layout
+        self.buffer = buffer
+
+def fromLog(log, prefix, start=None, stop=None):
+    """
+    Adds the entries of a text or binary log (see query.py) to the
+    rollups with the given prefix. Returns the number of entries added.
+    """
+    times, values = query(log, start, stop)
+    # Same layout as the Reading ngfec_auto would have filled: a text log
+    # is parsed with the widest layout, so trim the channels it never had
+    layout = []
+    for v in logVariables:
+        logged = np.nonzero(~np.isnan(values[v]).all(axis=0))[0]
+        if len(logged):
+            layout.append((v, logged[-1] + 1))
+    rows = np.concatenate([values[v][:, :n] for v, n in layout], axis=1) if layout else np.zeros((len(times), 0))
+    rollup = Rollup(prefix)
+    for t, row in zip(times, rows):
+        rollup.add(t, LogReading(layout, row))
+    return len(times)
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument("log", help="text or binary log from ngfec_auto")
+    parser.add_argument("prefix", help="prefix of the rollup files")
+    parser.add_argument("--start", "-s", default=None, help="first time to add")
+    parser.add_argument("--stop",  "-e", default=None, help="time to stop before")
+    args = parser.parse_args()
+    print "Added %d entries to %s_*.bin" % (fromLog(args.log, args.prefix, args.start, args.stop), args.prefix)
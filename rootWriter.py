@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#######################################################################
+#  rootWriter.py                                                      #
+#                                                                     #
+#  Appends one tree entry per reading to a series of fixed-size ROOT  #
+#  files (power_test_part1.root, power_test_part2.root, ...). Only    #
+#  the newest part is ever opened, so writing a reading costs the     #
+#  same on the first day of a burn-in as on the last. Read the whole  #
+#  history back with a TChain:                                        #
+#                                                                     #
+#  chain = TChain("t1")                                               #
+#  chain.Add("power_test_part*.root")                                 #
+#                                                                     #
+#######################################################################
+
+import glob
+import re
+from ROOT import TFile, TTree, TObject
+
+# Part number of a chunk file name
+r_part = re.compile(r"_part(\d+)\.root$")
+
+class RootWriter(object):
+    """
+    Keeps the newest chunk file and its tree open between readings.
+    chunkSize: entries per file (4320 is one day of 20 second readings)
+    flushEvery: entries between AutoSaves while the file stays open
+    """
+    def __init__(self, prefix = "power_test", treeName = "t1", chunkSize = 4320, flushEvery = 10):
+        self.prefix = prefix
+        self.treeName = treeName
+        self.chunkSize = chunkSize
+        self.flushEvery = flushEvery
+        self.tfile = None
+        self.tree = None
+        self.part = 0
+        self.filled = 0     # Entries filled since the last AutoSave
+
+    def fileName(self, part):
+        return "{0}_part{1}.root".format(self.prefix, part)
+
+    def lastPart(self):
+        parts = [int(r_part.search(f).group(1)) for f in glob.glob("{0}_part*.root".format(self.prefix)) if r_part.search(f)]
+        return max(parts) if parts else 0
+
+    def open(self):
+        # Continue the newest part if it has room, otherwise start a new one
+        self.part = self.lastPart()
+        if self.part > 0:
+            self.tfile = TFile(self.fileName(self.part), "update")
+            self.tree = self.tfile.Get(self.treeName)
+            if self.tree and self.tree.GetEntries() < self.chunkSize:
+                return
+            self.tfile.Close()
+        self.part += 1
+        self.tfile = TFile(self.fileName(self.part), "recreate")
+        self.tree = TTree(self.treeName, self.treeName)
+
+    def fill(self, branches):
+        """
+        Append one entry. branches is a list of (name, array, leaflist)
+        tuples; the arrays hold the values of this reading.
+        """
+        if self.tfile is None:
+            self.open()
+        for name, values, leaflist in branches:
+            if self.tree.GetBranch(name):
+                self.tree.SetBranchAddress(name, values)
+            else:
+                self.tree.Branch(name, values, leaflist)
+        self.tree.Fill()
+        self.filled += 1
+        if self.tree.GetEntries() >= self.chunkSize:
+            self.close()
+        elif self.filled >= self.flushEvery:
+            self.tree.AutoSave("SaveSelf")
+            self.filled = 0
+
+    def close(self):
+        if self.tfile is None:
+            return
+        self.tfile.cd()
+        self.tree.Write("", TObject.kOverwrite)
+        self.tfile.Close()
+        self.tfile = None
+        self.tree = None
+        self.filled = 0
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#######################################################################
+#  scheduling.py                                                      #
+#                                                                     #
+#  Timing shared by rbxMon.py and collector.py, kept apart from       #
+#  rbxMon.py (which loads ROOT) so it can be used and tested alone:   #
+#                                                                     #
+#  writeLog : appends a time-stamped message to an action log         #
+#  monotonic : a clock that never jumps with the system clock         #
+#  schedule : yields the run numbers of an interval on a fixed grid   #
+#                                                                     #
+#######################################################################
+
+import os
+import time as time_module
+from time import sleep
+from datetime import datetime
+
+def writeLog(message, logFile, verbose=1):
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    message = now + " " + message
+    logFile.write(message + "\n")
+    if verbose:
+        print message
+
+# Monotonic clock for scheduling. Python 2 has no time.monotonic, but the
+# elapsed real time from os.times() never jumps with the system clock.
+monotonic = getattr(time_module, "monotonic", lambda: os.times()[4])
+
+def schedule(steptime, intervaltime, policy="skip", logName=None):
+    """
+    Yields the run number of every step of an interval on a fixed grid:
+    reading n is due at start + n*steptime no matter how long the
+    readings before it took. A reading that runs past the next tick is
+    an overrun and is logged. Ticks missed during an overrun are either
+    dropped ("skip", the run number jumps ahead so it still matches the
+    grid) or replaced by one reading straight away ("compress").
+    """
+    start = monotonic()
+    nTicks = (intervaltime + steptime - 1) // steptime if steptime > 0 else 1
+    tick = 0
+    while tick < nTicks:
+        runNum = tick + 1
+        yield runNum
+        if tick + 1 >= nTicks:
+            break # don't sleep on the final iteration
+        now = monotonic()
+        late = now - (start + (tick + 1) * steptime)
+        if late < 0:
+            tick += 1
+            sleep(-late)
+            continue
+        missed = int(late // steptime) # ticks after the next one that have also passed
+        if policy == "compress":
+            # Take one reading now in place of every tick that has passed
+            tick += missed + 1
+            action = "taking tick %d now" % (tick + 1)
+        else:
+            # Wait for the first tick still in the future
+            tick += missed + 2
+            action = "skipping %d tick(s)" % (missed + 1)
+        if logName is not None:
+            with open(logName, 'a') as f:
+                writeLog("Overrun: reading %d ran %.1fs past the next tick, %s" % (runNum, late, action), f)
+        if tick < nTicks and policy != "compress":
+            sleep(max(0, start + tick * steptime - monotonic()))
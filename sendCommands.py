@@ -2,8 +2,12 @@ import sys
 from time import time, sleep
 from datetime import datetime
 
+import re
 from re import search, escape
 import os
+import atexit
+import threading
+import tempfile
 import subprocess
 import pexpect
 
@@ -32,101 +36,338 @@ def progress(i = 0, n = 0, name = None, k = 50): # i: iterator, k: total length
 
 cmds_default = ["quit"]
 
-def send_commands(cmds=cmds_default, script=False, raw=False, progbar=False, port = 4342, control_hub = "hcal904daq02"):
-	# Arguments and variables
-	output = []
-	raw_output = ""
-	if control_hub != False and port:		# Potential bug if "port=0" ... (Control_hub should be allowed to be None.)
-		## Parse commands:
-		if isinstance(cmds, str):
-			cmds = [cmds]
-		if not script:
-			if "quit" not in cmds:
-				cmds.append("quit")
-		else:
-			cmds = [c for c in cmds if c != "quit"]		# "quit" can't be in a ngFEC script.
-			cmds_str = ""
-			for c in cmds:
-				cmds_str += "{0}\n".format(c)
-			file_script = "ngfec_script"
-			with open(file_script, "w") as out:
-				out.write(cmds_str)
-		
+# One "cmd # result" record per line of ngFEC script output. The cmd group
+# may carry the ngFEC prompt in front of the command.
+r_record = re.compile(r"^([^\r\n#]*?)\s?#((?:\s|E)[^\r\n]*)\r?$", re.M)
+
+# End of the ngFEC prompt ("ngccm >") waiting for the next command
+r_prompt = re.compile(r">\s*$")
+
+def read_records(p, cmds, timeout = 30, first_timeout = 30, chunk = 4096, counter = None, deadline = None):
+	"""
+	Generator over the ngFEC output of a script, yielding one dictionary
+	per command in cmds (in order) with the keys of send_commands plus
+	"raw", the output line the record was parsed from. Output is read in
+	chunks and split into lines once, so only the current partial line
+	is kept in memory. A record is only complete once its line has been
+	terminated, so long results (e.g. 4x64 leakage currents) are never
+	cut short by a match against a half-read line. If a counter
+	dictionary is given, the bytes read are added to counter["bytes_read"].
+	A deadline (epoch time) bounds the whole script, whatever the timeouts.
+	"""
+	# Start with whatever an earlier expect left in the pexpect buffer:
+	buf = p.buffer
+	p.buffer = ""
+	i = 0
+	t0 = time()
+	wait = t0 + first_timeout
+	while i < len(cmds):
+		end = buf.rfind("\n") + 1
+		for m in r_record.finditer(buf, 0, end):
+			if not m.group(1).strip().endswith(cmds[i]):
+				continue		# Echoed input, banners, or results of commands we didn't ask for
+			t1 = time()
+			yield {
+				"cmd": cmds[i],
+				"result": m.group(2).strip().replace("'", ""),
+				"times": [t0, t1],
+				"raw": m.group(0),
+			}
+			i += 1
+			t0 = t1
+			wait = t0 + timeout
+			if i == len(cmds):
+				break
+		buf = buf[end:]
+		if i == len(cmds):
+			break
+		remaining = (min(wait, deadline) if deadline is not None else wait) - time()
+		if remaining <= 0:
+			p.buffer = buf
+			raise pexpect.TIMEOUT("No result for {0} after {1:.1f} seconds".format(cmds[i], time() - t0))
+		try:
+			data = p.read_nonblocking(size = chunk, timeout = remaining)
+		except pexpect.TIMEOUT:
+			continue
+		except pexpect.EOF:
+			p.buffer = buf
+			raise
+		if counter is not None:
+			counter["bytes_read"] += len(data)
+		buf += data
+	# Leave the rest of the output for the final expect:
+	p.buffer = buf + p.buffer
+
+class ngFECSession(object):
+	"""
+	A long-lived ngFEC.exe process connected to one ngccm server.
+	Commands are sent over the same process until it dies or stops
+	answering, at which point it is respawned on the next call. A run
+	in which every command came back as an ERROR (e.g. ngFEC lost its
+	ngccm connection) also gets the process replaced. If a probe is
+	given (a read-only command, never one of the caller's), it is sent
+	before reusing the process, and no answer or an ERROR replaces it.
+	"""
+	def __init__(self, port = 4342, control_hub = "hcal904daq02", maxread = 2000, probe = None):
+		self.port = port
+		self.control_hub = control_hub
+		self.maxread = maxread		# Bytes read from ngFEC at a time
+		self.probe = probe
+		self.p = None
+		self.stale = False		# Replace the process before the next run
+		self.spawns = 0		# Number of times ngFEC.exe has been started
+		self.lock = threading.Lock()		# One caller at a time per ngFEC process
+		self.metrics = {}		# Spawn time and bytes read during the last run
+	
+	def command(self):
 		# Prepare the ngfec arguments:
-		ngfec_cmd = 'ngFEC.exe -z -c -p {0}'.format(port)
-		if control_hub != None:
-			ngfec_cmd += " -H {0}".format(control_hub)
-		
-		# Send the ngfec commands:
-#		print ngfec_cmd
-		p = pexpect.spawn(ngfec_cmd)#, timeout=100, maxread=20000)
-#		print p.pid
+		ngfec_cmd = 'ngFEC.exe -z -c -p {0}'.format(self.port)
+		if self.control_hub != None:
+			ngfec_cmd += " -H {0}".format(self.control_hub)
+		return ngfec_cmd
+	
+	def connect(self):
+		if self.p is not None:
+			self.p.close(force=True)
+		t0 = time()
+		self.p = pexpect.spawn(self.command(), maxread=self.maxread)#, timeout=100)
+		self.stale = False
+		self.metrics["spawn_time"] = self.metrics.get("spawn_time", 0.0) + time() - t0
+		self.spawns += 1
+		return self.p
+	
+	def drain(self, quiet = 0.05):
+		# Discard output up to the next prompt (or until ngFEC goes quiet),
+		# so the rest of one run's output can't leak into the next run:
+		buf = self.p.buffer
+		self.p.buffer = ""
+		while not r_prompt.search(buf):
+			try:
+				buf = self.p.read_nonblocking(size = self.maxread, timeout = quiet)
+			except (pexpect.TIMEOUT, pexpect.EOF):
+				break
+	
+	def ping(self, cmd, timeout = 5):
+		# Send one command and check that ngFEC answers it without an ERROR:
+		try:
+			self.p.sendline(cmd)
+			self.p.expect("{0}\s?#((\s|E)[^\r^\n]*)".format(escape(cmd)), timeout = timeout)
+			self.drain()
+		except (pexpect.TIMEOUT, pexpect.EOF, OSError):
+			return False
+		return not self.p.match.group(1).strip().startswith("E")
+	
+	def alive(self, probe = None, timeout = 5):
+		if self.p is None or not self.p.isalive():
+			return False
+		return probe is None or self.ping(probe, timeout)
+	
+	def ensure(self, timeout = 5):
+		# Reconnect if the ngFEC process has died (or was never started),
+		# its last run failed, or it doesn't answer the probe command:
+		if self.stale or not self.alive(self.probe, timeout):
+			self.connect()
+		return self.p
+	
+	def close(self, timeout = 5):
+		# Send "quit" and return whatever ngFEC printed before exiting.
+		# A hung or already broken process is killed instead.
+		before = ""
+		try:
+			if self.alive():
+				self.p.send("quit")
+				self.p.send("\n")
+				self.p.expect(pexpect.EOF, timeout = timeout)
+				before = self.p.before
+		except (pexpect.TIMEOUT, pexpect.EOF, OSError):
+			pass
+		if self.p is not None:
+			try:
+				self.p.close(force=True)
+			except OSError:
+				pass
+		self.p = None
+		return before
+	
+	def run(self, cmds, script = False, progbar = False, deadline = None):
+		# Send commands over the session, returning (output, raw_output).
+		# If ngFEC dies mid-run the session is reconnected and the commands are sent once more.
+		# Past the deadline (epoch time) the process is killed instead, so the next call starts afresh.
+		cmds = [c for c in cmds if c != "quit"]
+		with self.lock:
+			self.metrics = {"spawn_time": 0.0, "bytes_read": 0}
+			try:
+				self.ensure(max(0, min(5, deadline - time())) if deadline is not None else 5)
+				output, raw_output = self._run(cmds, script, progbar, deadline)
+			except (pexpect.EOF, pexpect.TIMEOUT):
+				if deadline is not None and time() >= deadline:
+					self.close(timeout = 0)
+					raise
+				self.connect()
+				output, raw_output = self._run(cmds, script, progbar, deadline)
+			# Nothing but ERRORs: most likely ngFEC lost its ngccm connection
+			self.stale = len(output) > 0 and all(r["result"].find("ERROR") >= 0 for r in output)
+			return output, raw_output
+	
+	def _run(self, cmds, script, progbar, deadline = None):
+		output = []
+		raw_output = ""
+		p = self.p
 		if not script:
 			for i, c in enumerate(cmds):
 #				print c
 				p.sendline(c)
-				if c != "quit":
-					if progbar:
-						progress(i, len(cmds), cmds[i].split()[1])
-					t0 = time()
-					p.expect("{0}\s?#((\s|E)[^\r^\n]*)".format(escape(c)))
-					t1 = time()
-					#print [p.match.group(0)]
-					#print "%s%s" %(p.before, p.after)
-					# Use raw output
-					output.append({
-						"cmd": c,
-						"result": p.before + p.after, 
-						"times": [t0, t1],
-					})
-#					output.append({
-#						"cmd": c,
-#						"result": p.match.group(1).strip().replace("'", ""),
-#		  			"times": [t0, t1],
-#					})
-					raw_output += p.before + p.after
-		else:
-			#p.sendline("< {0}".format(file_script))
-			p.send("< {0}".format(file_script))
-			p.send("\n")
-			for i, c in enumerate(cmds):
-				# Deterimine how long to wait until the first result is expected:
-				if i == 0:
-					timeout = max([30, int(0.0075*len(cmds))])
-#					print i, c, timeout
-				else:
-					timeout = 30		# pexpect default
-#					print i, c, timeout
-#				print i, c, timeout
-				
-				# Send commands:
 				if progbar:
 					progress(i, len(cmds), cmds[i].split()[1])
 				t0 = time()
+				timeout = max(0, deadline - time()) if deadline is not None else -1		# -1: pexpect default
 				p.expect("{0}\s?#((\s|E)[^\r^\n]*)".format(escape(c)), timeout=timeout)
 				t1 = time()
-				#print "pexpect output0: ",[p.match.group(0)]
+				#print [p.match.group(0)]
+				#print "%s%s" %(p.before, p.after)
+				# Use raw output
 				output.append({
 					"cmd": c,
-					"result": p.match.group(1).strip().replace("'", ""),
+					"result": p.before + p.after, 
 					"times": [t0, t1],
 				})
-				#print "result = ", output[-1]['result']
+#				output.append({
+#					"cmd": c,
+#					"result": p.match.group(1).strip().replace("'", ""),
+#		  		"times": [t0, t1],
+#				})
 				raw_output += p.before + p.after
-			#p.sendline("quit")
-			p.send("quit")
-			p.send("\n")
+				self.metrics["bytes_read"] += len(p.before + p.after)
+			self.drain()
+		else:
+			cmds_str = ""
+			for c in cmds:
+				cmds_str += "{0}\n".format(c)
+			# Every session gets its own script, so sessions running at once (poll_targets) can't overwrite each other's:
+			fd, file_script = tempfile.mkstemp(prefix = "ngfec_script_{0}_{1}_".format(self.control_hub, self.port), dir = os.getcwd())
+			try:
+				with os.fdopen(fd, "w") as out:
+					out.write(cmds_str)
+				#p.sendline("< {0}".format(file_script))
+				p.send("< {0}".format(file_script))
+				p.send("\n")
+				# Deterimine how long to wait until the first result is expected:
+				first_timeout = max([30, int(0.0075*len(cmds))])
+				for i, record in enumerate(read_records(p, cmds, first_timeout = first_timeout, chunk = self.maxread, counter = self.metrics, deadline = deadline)):
+					if progbar:
+						progress(i, len(cmds), cmds[i].split()[1])
+					raw_output += record.pop("raw")
+					output.append(record)
+					#print "result = ", output[-1]['result']
+			finally:
+				os.remove(file_script)
 		if progbar:
 			progress()
-		p.expect(pexpect.EOF)
-		raw_output += p.before
-		output[-1]["result"] += p.before
+		return output, raw_output
+
+# Pool of open sessions keyed by (control_hub, port)
+sessions = {}
+
+# Read-only command to check pooled sessions with before reusing them (None: no probe)
+probe_default = None
+
+def get_session(port = 4342, control_hub = "hcal904daq02", maxread = 2000):
+	key = (control_hub, port)
+	if key not in sessions:
+		sessions[key] = ngFECSession(port = port, control_hub = control_hub, maxread = maxread, probe = probe_default)
+	# Never shrink the read buffer of a session someone else asked to enlarge:
+	sessions[key].maxread = max(sessions[key].maxread, maxread)
+	return sessions[key]
+
+def close_sessions():
+	for key in sessions.keys():
+		sessions.pop(key).close()
+
+atexit.register(close_sessions)
+
+def send_commands(cmds=cmds_default, script=False, raw=False, progbar=False, port = 4342, control_hub = "hcal904daq02", persistent=False, maxread=2000, metrics=None, deadline=None):
+	# Arguments and variables
+	output = []
+	raw_output = ""
+	if control_hub != False and port:		# Potential bug if "port=0" ... (Control_hub should be allowed to be None.)
+		## Parse commands:
+		if isinstance(cmds, str):
+			cmds = [cmds]
+		
+		# Send the ngfec commands, either over a pooled session that stays open
+		# or over a fresh ngFEC process that is quit afterwards:
+		if persistent:
+			session = get_session(port = port, control_hub = control_hub, maxread = maxread)
+		else:
+			session = ngFECSession(port = port, control_hub = control_hub, maxread = maxread)
+		output, raw_output = session.run(cmds, script = script, progbar = progbar, deadline = deadline)
+		# Pass the session's spawn time and bytes read back to the caller:
+		if metrics is not None:
+			metrics.update(session.metrics)
+		if not persistent:
+			before = session.close()
+			raw_output += before
+			if output:
+				output[-1]["result"] += before
 		#print "raw_output = ",raw_output
-#		sleep(1)		# I need to make sure the ngccm process is killed.
-		p.close()
-#		print "closed"
 		if raw:
 			return raw_output
 		else:
 			return output
 
+def poll_targets(targets, cmds=cmds_default, script=True, timeout=60, persistent=True):
+	"""
+	Send command lists to several (control_hub, port) targets at once,
+	one thread per target. cmds is either one list sent to every target
+	or a dict of lists keyed by target. Returns a single reading:
+	
+	date : [date and time the sweep started]
+	time : [epoch time the sweep started]
+	results : {target: send_commands output, or None if it failed}
+	timeouts : [targets that did not answer within timeout seconds]
+	errors : {target: exception message}
+	
+	The timeout is passed down to every session, which gives up (and
+	kills its ngFEC process) at the deadline rather than holding on to
+	the target into the next sweep.
+	"""
+	reading = {
+		"date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+		"time": time(),
+		"results": {},
+		"timeouts": [],
+		"errors": {},
+	}
+	# Every target shares the same deadline, so the sweep takes as long as the slowest target:
+	deadline = reading["time"] + timeout
+	
+	def worker(target):
+		control_hub, port = target
+		target_cmds = cmds[target] if isinstance(cmds, dict) else list(cmds)
+		try:
+			reading["results"][target] = send_commands(cmds=target_cmds, script=script, port=port, control_hub=control_hub, persistent=persistent, deadline=deadline)
+		except Exception as e:
+			reading["errors"][target] = str(e)
+	
+	threads = []
+	for target in targets:
+		reading["results"][target] = None
+		thread = threading.Thread(target=worker, args=(target,))
+		thread.daemon = True		# Don't let a hung ngFEC keep the interpreter alive
+		thread.start()
+		threads.append((target, thread))
+	
+	for target, thread in threads:
+		thread.join(max(0, deadline - time()))
+		if thread.is_alive():
+			reading["timeouts"].append(target)
+			# Start the next sweep on a new session instead of waiting for this one's lock:
+			if persistent:
+				sessions.pop(target, None)
+	
+	# Copy the results so late answers from timed-out targets don't change this reading:
+	results = dict(reading["results"])
+	for target in reading["timeouts"]:
+		results[target] = None
+	reading["results"] = results
+	return reading
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#######################################################################
+#  snapshots.py                                                       #
+#                                                                     #
+#  Loads the daily measurements/ snapshots (humidity-21-JUN-2017.txt, #
+#  temperature-4-JUL-2017.txt, ...) into one (date x RBX-RM) matrix   #
+#  per kind:                                                          #
+#                                                                     #
+#  names    : file name of each snapshot, without .txt                #
+#  dates    : date of each snapshot (datetime64[D]), sorted           #
+#  channels : "HE<rbx>-<rm>" of each column                           #
+#  values   : float64 matrix, NaN where a snapshot has no value       #
+#                                                                     #
+#  The matrix is cached in <directory>/<kind>_cache.npz and rebuilt   #
+#  when a snapshot is added, removed or modified.                     #
+#                                                                     #
+#######################################################################
+
+import os
+import re
+from datetime import datetime
+import numpy as np
+
+directory_default = "measurements/"
+
+# Snapshot file names: kind, day, month and year
+r_snapshot = re.compile(r"^([a-z]+)-(\d+-[A-Za-z]+-\d{4})\.txt$")
+
+# Snapshot lines, e.g. "HE1-2-humidityS_f 5.7404" or "_ HE1-2-humidityS_f 5.7404"
+r_value = re.compile(r"^(?:_\s+)?([A-Z]+\d+-\d+)-\S+\s+([-+]?[\d.]+(?:[eE][-+]?\d+)?)")
+
+def cacheName(kind, directory=directory_default):
+    return os.path.join(directory, "%s_cache.npz" % kind)
+
+def findSnapshots(kind, directory=directory_default):
+    """
+    Returns [(date, name, path), ...] of the snapshots of a kind, by date
+    """
+    found = []
+    for f in os.listdir(directory):
+        m = r_snapshot.match(f)
+        if m and m.group(1) == kind:
+            date = datetime.strptime(m.group(2), "%d-%b-%Y").date()
+            found.append((date, f[:-len(".txt")], os.path.join(directory, f)))
+    return sorted(found)
+
+def parseSnapshot(path):
+    # {channel: value} of one snapshot; lines starting with # are skipped
+    values = {}
+    with open(path, "r") as f:
+        for line in f:
+            m = r_value.match(line)
+            if m:
+                values[m.group(1)] = float(m.group(2))
+    return values
+
+def channelKey(channel):
+    # Sort "HE2-1" before "HE10-1"
+    return tuple(int(x) for x in re.findall(r"\d+", channel))
+
+def buildSnapshots(found):
+    parsed = [parseSnapshot(path) for date, name, path in found]
+    channels = sorted(set(c for values in parsed for c in values), key=channelKey)
+    column = dict((c, i) for i, c in enumerate(channels))
+    matrix = np.full((len(found), len(channels)), np.nan)
+    for row, values in enumerate(parsed):
+        for c, value in values.items():
+            matrix[row, column[c]] = value
+    return {
+        "names": np.array([name for date, name, path in found]),
+        "dates": np.array([str(date) for date, name, path in found], dtype="datetime64[D]"),
+        "channels": np.array(channels),
+        "values": matrix,
+    }
+
+def loadSnapshots(kind, directory=directory_default):
+    """
+    Returns the snapshot matrix of a kind (see above), from the cache if
+    no snapshot file changed since it was written
+    """
+    found = findSnapshots(kind, directory)
+    files = np.array([name for date, name, path in found])
+    mtimes = np.array([os.path.getmtime(path) for date, name, path in found])
+    cache = cacheName(kind, directory)
+    if os.path.exists(cache):
+        cached = np.load(cache)
+        if len(cached["files"]) == len(files) and (cached["files"] == files).all() and (cached["mtimes"] == mtimes).all():
+            return dict((key, cached[key]) for key in ["names", "dates", "channels", "values"])
+    snapshots = buildSnapshots(found)
+    with open(cache, "wb") as f:
+        np.savez(f, files=files, mtimes=mtimes, **snapshots)
+    return snapshots
@@ -10,11 +10,20 @@
 #                                                                      #
 ########################################################################
 
+import os
 import sys
 from argparse import ArgumentParser
 import ROOT
 from pprint import pprint
-from ROOT import TGraph, TMultiGraph, TH1D, TLegend, TCanvas, TPad, gStyle, kRed, kBlue, kOrange, kCyan, kGreen, kBlack, kViolet, kMagenta
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from datetime import datetime
+from binLog import isBinLog, loadBinLog
+from logIndex import readLines
+from query import getLayout, parseLines, query
+from reading import missing
+import rollup
+from ROOT import TGraph, TMultiGraph, TH1D, TH2D, TLegend, TCanvas, TPad, gStyle, kRed, kBlue, kOrange, kCyan, kGreen, kBlack, kViolet, kMagenta
 ROOT.gROOT.SetBatch(True)
 
 #COLORS = [kRed, kCyan+1, kGreen+2, kViolet+1]
@@ -35,7 +44,7 @@ gStyle.SetStatX(1.0)
 gStyle.SetStatY(0.9)
 
 
-def plotMultiGraph(dataReadings, vals, title, xTitle, yTitle, outF):
+def plotMultiGraph(dataReadings, vals, title, xTitle, yTitle, outF, labels=None):
     """
     Plots several TGraphs using TMultiGraph
     """
@@ -46,7 +55,7 @@ def plotMultiGraph(dataReadings, vals, title, xTitle, yTitle, outF):
     pad.cd()
     for a in xrange(len(vals)):
         print "vals[a] = {0}".format(vals[a])
-        l.AddEntry(vals[a], "Value %d" % (a+1), "pl")
+        l.AddEntry(vals[a], labels[a] if labels else "Value %d" % (a+1), "pl")
         mg.Add(vals[a])
     mg.Draw("alp")
     pad.Update()
@@ -88,12 +97,328 @@ def plotHisto(histo, outF):
     cv.SaveAs(outF)
 
 
+def plotHeatmap(histo, outF):
+    """
+    Plots a (pre-filled) 2D histogram with a color scale
+    """
+    cv = TCanvas(outF + "M", "cv", 1200, 1200)
+    pad = TPad("p","p", 0.05, 0.0, 0.95, 1.0)
+    pad.SetRightMargin(0.15)
+    pad.cd()
+    histo.Draw("COLZ")
+    pad.Update()
+    cv.cd()
+    pad.Draw()
+    cv.SaveAs(outF)
+
+
+def readTextLog(log, first, last, variables):
+    """
+    Reads entries first..last of a text log from ngfec_auto
+    """
+    # Read only the requested lines (the end of the log is found without scanning it)
+    try:
+        lines = readLines(log, first, last)
+    except (IOError, OSError):
+        print "Unable to open file:", log
+        sys.exit()
+    print "Read %d entries from %s" % (len(lines), log)
+    return parseLines(list(line for l, line in lines), variables)
+
+
+def binReadings(schema, records, variables):
+    readings = []
+    for t in records["time"]:
+        stamp = datetime.fromtimestamp(t)
+        readings.append({"date": stamp.strftime('%Y-%m-%d'), "time": stamp.strftime('%H:%M:%S')})
+    names = [v for v, n in schema]
+    values = {}
+    for v in variables:
+        if v in names:
+            values[v] = np.asarray(records[v], dtype=np.float64)
+            values[v][values[v] == missing] = np.nan
+        else:
+            values[v] = np.full((len(records), 0), np.nan)
+    return readings, values
+
+
+def readBinLog(log, first, last, variables):
+    """
+    Reads entries first..last of a binary log (see binLog.py). Returns
+    the same as readTextLog.
+    """
+    schema, records = loadBinLog(log)
+    nRecords = len(records)
+    start = first - 1 if first > 0 else max(0, nRecords + first) if first < 0 else 0
+    stop = last if last > 0 else nRecords + last
+    return binReadings(schema, records[start:stop], variables)
+
+
+def readLog(log, first, last, variables):
+    if isBinLog(log):
+        return readBinLog(log, first, last, variables)
+    return readTextLog(log, first, last, variables)
+
+
+def readTimeRange(log, start, stop, variables):
+    """
+    Reads the entries of a text or binary log with start <= time < stop
+    (see query.py). Returns the same as readTextLog.
+    """
+    times, values = query(log, start, stop, variables)
+    readings = []
+    for t in times:
+        stamp = datetime.fromtimestamp(t)
+        readings.append({"date": stamp.strftime('%Y-%m-%d'), "time": stamp.strftime('%H:%M:%S')})
+    print "Read %d entries from %s" % (len(readings), log)
+    return readings, values
+
+
+def logLength(log):
+    # Largest valid cursor of a log: its record count if binary, its size in bytes if text
+    if isBinLog(log):
+        return len(loadBinLog(log)[1])
+    return os.path.getsize(log)
+
+
+def readNewEntries(log, cursor, variables):
+    """
+    Reads the entries appended to a log since cursor (a byte offset for
+    text logs, a record number for binary logs). Returns the readings,
+    values and the new cursor.
+    """
+    if isBinLog(log):
+        schema, records = loadBinLog(log, start=cursor)
+        readings, values = binReadings(schema, records, variables)
+        return readings, values, cursor + len(records)
+    with open(log, "rb") as f:
+        f.seek(cursor)
+        data = f.read()
+    # Leave a partially written line for next time
+    data = data[:data.rfind("\n") + 1]
+    readings, values = parseLines(data.splitlines(), variables)
+    return readings, values, cursor + len(data)
+
+
+def updateHisto(state, v, values, nBins=50):
+    """
+    Adds an array of values to the histogram of variable v kept in
+    state as bin edges and counts. If the new values fall outside the
+    edges, the histogram is rebinned over the wider range first.
+    """
+    finite = values[~np.isnan(values)]
+    if finite.size == 0:
+        return
+    varMin, varMax = finite.min(), finite.max()
+    if v + "_edges" in state:
+        edges = state[v + "_edges"]
+        counts = state[v + "_counts"]
+        varMin = min(varMin, state[v + "_min"])
+        varMax = max(varMax, state[v + "_max"])
+    else:
+        edges = None
+        counts = None
+    width = 0.15 * (varMax - varMin)   # Sets the spacing around a TH1D plot based on the max/min vals
+    if edges is None or varMin < edges[0] or varMax > edges[-1]:
+        low, high = varMin - width, varMax + width
+        # A constant variable still gets a range of at least +-max(0.5, 1% of its value)
+        half = max(0.5, 0.01 * max(abs(varMin), abs(varMax)))
+        if high - low < 2 * half:
+            center = 0.5 * (varMin + varMax)
+            low, high = center - half, center + half
+        newEdges = np.linspace(low, high, nBins + 1)
+        if counts is None:
+            counts = np.zeros(nBins)
+        else:
+            # Move the old counts to the new bins by their bin centers
+            centers = 0.5 * (edges[1:] + edges[:-1])
+            counts = np.histogram(centers, newEdges, weights=counts)[0]
+        edges = newEdges
+    state[v + "_edges"] = edges
+    state[v + "_counts"] = counts + np.histogram(finite, edges)[0]
+    state[v + "_min"] = varMin
+    state[v + "_max"] = varMax
+
+
+def loadState(stateFile):
+    try:
+        with open(stateFile, "rb") as f:
+            saved = np.load(f)
+            return dict((k, saved[k]) for k in saved.files)
+    except IOError:
+        return {"cursor": 0}
+
+
+def saveState(stateFile, state):
+    with open(stateFile, "wb") as f:
+        np.savez(f, **state)
+
+
+def makeHisto(v, j, edges, counts):
+    """
+    Books a histogram over edges and sets all of its bin contents at once
+    """
+    histo = TH1D(titles[v][0], titles[v][1], len(edges) - 1, edges[0], edges[-1])
+    histo.SetFillColor(COLORS[j])
+    histo.GetXaxis().SetTitle(titles[v][2])
+    histo.GetYaxis().SetTitle(titles[v][3])
+    histo.GetYaxis().SetTitleOffset(2.1)
+    # SetContent also covers the underflow and overflow bins
+    histo.SetContent(np.concatenate([[0.], counts, [0.]]).astype(np.float64))
+    histo.SetEntries(counts.sum())
+    return histo
+
+
+def makeGraph(y):
+    """
+    Makes a TGraph of y against the entry number, skipping NaN
+    """
+    x = np.arange(len(y), dtype=np.float64)
+    valid = ~np.isnan(y)
+    x = np.ascontiguousarray(x[valid])
+    y = np.ascontiguousarray(y[valid], dtype=np.float64)
+    return TGraph(len(x), x, y)
+
+
+def renderVariable(job):
+    """
+    Makes the histogram and TMultiGraph plots of one variable. job is a
+    tuple (variable, color index, histogram edges, histogram counts,
+    readings, values, output directory) of plain values and numpy
+    arrays, so it can be pickled and sent to a worker process.
+    """
+    v, j, edges, counts, readings, values, out = job
+
+    # Make TH1D plots
+    histo = makeHisto(v, j, edges, counts)
+    plotHisto(histo, out + "%s_histo.png" % titles[v][0])
+
+    # Too many channels for one TGraph each: heatmap and envelope instead
+    if v == "leakI" and len(readings):
+        makeLeakagePlots(readings, values, out)
+
+    # Make TMultiGraph plots, one TGraph per channel
+    if v != "leakI" and len(readings):
+        graphs = []
+        for i in xrange(values.shape[1]):
+            graph = makeGraph(values[:, i])
+            graph.SetLineColor(COLORS[i])
+            graph.SetLineWidth(2)
+            graph.SetMarkerStyle(MARKERS[i])
+            graph.SetMarkerSize(2)
+            graph.SetMarkerColor(COLORS[i])
+            graphs.append(graph)
+        plotMultiGraph(readings, graphs, titles[v][1], "Time", titles[v][2], out + "%s_graph.png" % titles[v][0])
+    return v
+
+
+def downsample(values, nBuckets):
+    """
+    Splits an (entries x channels) array into at most nBuckets groups of
+    consecutive entries and returns the center entry number of each
+    bucket and the per-channel (min, mean, max) over each bucket,
+    ignoring NaN
+    """
+    nEntries = values.shape[0]
+    size = max(1, int(np.ceil(float(nEntries) / nBuckets)))
+    starts = np.arange(0, nEntries, size)
+    centers = starts + 0.5 * (np.minimum(starts + size, nEntries) - 1 - starts)
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid, starts, axis=0).astype(np.float64)
+    sums = np.add.reduceat(np.where(valid, values, 0.), starts, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    mins = np.fmin.reduceat(values, starts, axis=0)
+    maxs = np.fmax.reduceat(values, starts, axis=0)
+    return centers, mins, means, maxs
+
+
+def makeLeakagePlots(readings, values, out, maxBins=500):
+    """
+    Makes a channel x time heatmap of the leakage currents and a graph
+    of their min/mean/max envelope over all channels. Long ranges are
+    downsampled to maxBins time bins first, so the cost depends on the
+    plot size rather than the number of entries.
+    """
+    nEntries, nChannels = values.shape
+    centers, mins, means, maxs = downsample(values, maxBins)
+    nBins = len(centers)
+
+    # Heatmap: bin contents set in one call, laid out as ROOT's global bins (x + (nx+2)*y)
+    heatmap = TH2D("LeakIMap", "SiPM Leakage Current (\muA)", nBins, -0.5, nEntries - 0.5, nChannels, 0.5, nChannels + 0.5)
+    contents = np.zeros((nChannels + 2, nBins + 2))
+    contents[1:-1, 1:-1] = np.nan_to_num(means.T)
+    heatmap.SetContent(contents.ravel().astype(np.float64))
+    heatmap.SetEntries(np.count_nonzero(~np.isnan(values)))
+    heatmap.GetXaxis().SetTitle("Entry")
+    heatmap.GetYaxis().SetTitle("SiPM channel")
+    heatmap.GetYaxis().SetTitleOffset(2.1)
+    plotHeatmap(heatmap, out + "LeakI_map.png")
+
+    # Envelope over all channels
+    with np.errstate(invalid="ignore"):
+        envelope = [np.nanmin(mins, axis=1), np.nanmean(means, axis=1), np.nanmax(maxs, axis=1)]
+    graphs = []
+    for i, y in enumerate(envelope):
+        valid = ~np.isnan(y)
+        graph = TGraph(np.count_nonzero(valid), np.ascontiguousarray(centers[valid], dtype=np.float64), np.ascontiguousarray(y[valid]))
+        graph.SetLineColor(COLORS[i])
+        graph.SetLineWidth(2)
+        graph.SetMarkerColor(COLORS[i])
+        graphs.append(graph)
+    plotMultiGraph(readings, graphs, titles["leakI"][1], "Time", titles["leakI"][2], out + "LeakI_graph.png", ["Min", "Mean", "Max"])
+
+
+titles = {} # name, title, x-axis unit, y-axis unit
+titles["temps"]  = ["Temp",      "Peltier Temperature (^{o}C)",  "Temp (^{o}C)",     "Entries"]
+titles["hums"]   = ["Humidity",  "Peltier Humidity (%)",         "Humidity (%)",     "Entries"]
+titles["peltV"]  = ["PeltV",     "Peltier Voltage (V)",          "Voltage (V)",      "Entries"]
+titles["peltI"]  = ["PeltI",     "Peltier Current (A)",          "Current (A)",      "Entries"]
+titles["BVin"]   = ["BVin",      "Bulk Bias Voltage (V)",        "Voltage (V)",      "Entries"]
+titles["Vin"]    = ["Vin",       "Backplane Voltage (V)",        "Voltage (V)",      "Entries"]
+titles["leakI"]  = ["LeakI",     "SiPM Leakage Current (\muA)",  "Current (\mA)",    "Entries"]
+titles["cardT"]  = ["CardTemp",  "RM QIE Card Temperature (^{o}C)", "Temp (^{o}C)",     "Entries"]
+titles["calibT"] = ["CalibTemp", "CU QIE Card Temperature (^{o}C)", "Temp (^{o}C)",     "Entries"]
+titles["setV"]   = ["SetV",      "Set Peltier Voltage (V)",      "Voltage (V)",      "Entries"]
+titles["targetT"] = ["TargetTemp", "Peltier Target Temperature (^{o}C)", "Temp (^{o}C)", "Entries"]
+
+
+def readRollup(prefix, start, stop, width, variables):
+    """
+    Reads the mean of each bucket of the coarsest rollup (see rollup.py)
+    that still gives width points between start and stop. Returns the
+    same as readTextLog.
+    """
+    resolution, times, values = rollup.select(prefix, start, stop, width, variables)
+    readings = []
+    for t in times:
+        stamp = datetime.fromtimestamp(t)
+        readings.append({"date": stamp.strftime('%Y-%m-%d'), "time": stamp.strftime('%H:%M:%S')})
+    print "Read %d points from %s" % (len(readings), rollup.rollupName(prefix, resolution))
+    return readings, values
+
+
+def selectEntries(args, variables):
+    # Graph entries from the rollups if given, by time if --start or --stop was given, otherwise by line number
+    if args.rollup is not None:
+        return readRollup(args.rollup, args.start, args.stop, args.width, variables)
+    if args.start is not None or args.stop is not None:
+        return readTimeRange(args.log, args.start, args.stop, variables)
+    return readLog(args.log, args.min, args.max, variables)
+
+
 def main():
     parser = ArgumentParser()
     parser.add_argument("log", help="log file from ngfec_auto")
     parser.add_argument("--min", "-n", type=int, default=0, help="lower range bound (neg vals count backwards from the end)")
     parser.add_argument("--max", "-x", type=int, default=0, help="upper range bound (neg vals count backwards from the end)")
     parser.add_argument("--out", "-o", default="plots/", help="directory to save plots in")
+    parser.add_argument("--jobs", "-j", type=int, default=cpu_count(), help="number of processes to render plots with")
+    parser.add_argument("--start", default=None, help="only plot entries from this time on, e.g. \"2017-07-04 02:00\" (instead of --min/--max)")
+    parser.add_argument("--stop",  default=None, help="only plot entries before this time")
+    parser.add_argument("--rollup", "-r", default=None, help="prefix of rollup files to plot graphs from (see rollup.py)")
+    parser.add_argument("--width", "-w", type=int, default=1000, help="points wanted across a graph when plotting from rollups")
+    parser.add_argument("--state", "-s", default=None, help="state file to keep histograms in between runs (only entries added since the last run are read)")
     args = parser.parse_args()
     
     #variables = ["temp", "hum", "peltV", "peltI", "BVin", "Vin", "leakI"]
@@ -101,363 +426,43 @@ def main():
     
     if args.out[-1] != "/":
         args.out += "/"
-    readings = []
-    varMins = {}
-    varMaxs = {}
-    for v in variables:
-        varMins[v] = 9999.0 
-        varMaxs[v] = -9999.0 
-    '''
-    # temperature
-    minT = 9999.0
-    maxT = -9999.0
-    # humidity
-    minH = 101.0
-    maxH = -1.0
-    # peltier voltage
-    minPV = 9999.0
-    maxPV = -9999.0
-    # peltier current
-    minPI = 9999.0
-    maxPI = -9999.0
-    # BVin
-    minBVin = 9999.0
-    maxBVin = -9999.0
-    # Vin
-    minVin = 9999.0
-    maxVin = -9999.0
-    # leakage current
-    minLI = 9999.0
-    maxLI = -9999.0
-    # RM temperature
-    minTRM = 9999.0
-    maxTRM = -9999.0
-    # CU temperature
-    minTCU = 9999.0
-    maxTCU = -9999.0
-    # RM humidity
-    minHRM = 101.0
-    maxHRM = -1.0
-    # CU humidity
-    minHCU = 101.0
-    maxHCU = -1.0
-    # RTD temperature
-    minTRTD = 9999.0
-    maxTRTD = -9999.0
-    ''' 
-    # Count the number of lines in the log file
-    lineCount = 0
-    try:
-        with open(args.log, "r") as fa:
-            for lineCount, line in enumerate(fa,1):    # Starts the counter at 1
-                None
-    except:
-        print "Unable to open file:", args.log
-        sys.exit()
-    
-    #print "Total lines:", lineCount 
-    lineStart = args.min if args.min >= 0 else lineCount + args.min + 1
-    lineEnd = args.max if args.max > 0 else lineCount + args.max + 1
-
-    #print "lineStart =", lineStart
-    #print "lineEnd =", lineEnd
-    # HE has 48 channels per RM
-    # HB has 64 channels per RM
-    nRMchs = 64
-    nRMs = 4
-    #params = ["temp", "hum", "peltV", "peltI", "BVin", "Vin"]
-    with open(args.log, "r") as f:
-        for l, line in enumerate(f,1):
-            if lineStart <= l <= lineEnd:
-                data = line.split()
-                print "Reading line %d with %d data values" % (l, len(data))
-                entry = {}
-                entry["date"] = data[0]
-                entry["time"] = data[1]
-                n = 2
-                for v in variables:
-                    print "v: {0} n: {1}".format(v, n)
-                    if v == "leakI":
-                        # we need to update this try because leakage currents are not read last right now...
-                        try:
-                            entry[v] = [float(data[i]) for i in xrange(n, n + nRMs * nRMchs)]
-                            n += nRMs * nRMchs
-                        except:
-                            # Read error with leakage currents
-                            entry["leakI"] = []
-                    elif v in ["cardT"]:
-                        entry[v] = [float(data[i]) for i in xrange(n, n + 4 * nRMs)]
-                        n += 4 * nRMs
-                    elif v in ["calibT"]:
-                        entry[v] = [float(data[i]) for i in xrange(n, n + 1)]
-                        n += 1
-                    else: 
-                        entry[v] = [float(data[i]) for i in xrange(n, n + nRMs)]
-                        n += nRMs
-                    
-                    varMins[v] = min(varMins[v], min(entry[v]))
-                    varMaxs[v] = max(varMaxs[v], max(entry[v]))
-
-                '''
-                entry[p] = [float(data[i]) for i in xrange(2, 6)]
-                entry[p] = [float(data[i]) for i in xrange(6, 10)]
-                entry[p] = [float(data[i]) for i in xrange(10, 14)]
-                entry[p] = [float(data[i]) for i in xrange(14, 18)]
-                entry[p] = [float(data[i]) for i in xrange(18, 22)]
-                entry[p] = [float(data[i]) for i in xrange(22, 26)]
-                
-                minT = min(minT, min(entry["temp"]))
-                maxT = max(maxT, max(entry["temp"]))
-                minH = min(minH, min(entry["hum"]))
-                maxH = max(maxH, max(entry["hum"]))
-                minPV = min(minPV, min(entry["peltV"]))
-                maxPV = max(maxPV, max(entry["peltV"]))
-                minPI = min(minPI, min(entry["peltI"]))
-                maxPI = max(maxPI, max(entry["peltI"]))         
-                minBVin = min(minBVin, min(entry["BVin"]))
-                maxBVin = max(maxBVin, max(entry["BVin"]))
-                minVin = min(minVin, min(entry["Vin"]))
-                maxVin = max(maxVin, max(entry["Vin"]))
-                minTRM = min(minTRM, min(entry["tempRM"]))
-                maxTRM = min(maxTRM, min(entry["tempRM"]))
-                minTCU = min(minTCU, min(entry["tempCU"]))
-                maxTCU = min(maxTCU, min(entry["tempCU"]))
-                minHRM = min(minHRM, min(entry["humRM"]))
-                maxHRM = min(maxHRM, min(entry["humRM"]))
-                minHCU = min(minHCU, min(entry["humCU"]))
-                maxHCU = min(maxHCU, min(entry["humCU"]))
-                minTRTD = min(minTRTD, min(entry["tempRTD"]))
-                maxTRTD = min(maxTRTD, min(entry["tempRTD"]))
-                '''
-                readings.append(entry)
-
-    '''
-    tempG = []
-    humG = []
-    peltVG = []
-    peltIG = []
-    BVinG = []
-    VinG = []
-    
-    tempMG = TMultiGraph()
-    humMG = TMultiGraph()
-    peltVMG = TMultiGraph()
-    peltIMG = TMultiGraph()
-    BVinMG = TMultiGraph()
-    VinMG = TMultiGraph()
-    '''
-    
-    # Initialize TGraphs
-    graphs = {}
-    for v in variables:
-        graphs[v] = []
-        if v != "leakI":
-            for i in xrange(len(readings[0][v])):
-                print "Create graphs for variable: %s i: %d" % (v, i)
-                graphs[v].append(TGraph())
-                graphs[v][i].SetLineColor(COLORS[i])
-                graphs[v][i].SetLineWidth(2)
-                graphs[v][i].SetMarkerStyle(MARKERS[i])
-                graphs[v][i].SetMarkerSize(2)
-                graphs[v][i].SetMarkerColor(COLORS[i])
-
-    '''
-    for i in range(len(readings[0]["temp"])):
-        tempG.append(TGraph())
-        tempG[i].SetLineColor(COLORS[i])
-        tempG[i].SetLineWidth(2)
-        tempG[i].SetMarkerStyle(MARKERS[i])
-        tempG[i].SetMarkerSize(2)
-        tempG[i].SetMarkerColor(COLORS[i])
-
-    for i in range(len(readings[0]["hum"])):
-        humG.append(TGraph())
-        humG[i].SetLineColor(COLORS[i])
-        humG[i].SetLineWidth(2)
-        humG[i].SetMarkerStyle(MARKERS[i])
-        humG[i].SetMarkerSize(2)
-        humG[i].SetMarkerColor(COLORS[i])
-
-    for i in range(len(readings[0]["peltV"])):
-        peltVG.append(TGraph())
-        peltVG[i].SetLineColor(COLORS[i])
-        peltVG[i].SetLineWidth(2)
-        peltVG[i].SetMarkerStyle(MARKERS[i])
-        peltVG[i].SetMarkerSize(2)
-        peltVG[i].SetMarkerColor(COLORS[i])
-
-    for i in range(len(readings[0]["peltI"])):
-        peltIG.append(TGraph())
-        peltIG[i].SetLineColor(COLORS[i])
-        peltIG[i].SetLineWidth(2)
-        peltIG[i].SetMarkerStyle(MARKERS[i])
-        peltIG[i].SetMarkerSize(2)
-        peltIG[i].SetMarkerColor(COLORS[i])
-    
-    for i in range(len(readings[0]["BVin"])):
-        BVinG.append(TGraph())
-        BVinG[i].SetLineColor(COLORS[i])
-        BVinG[i].SetLineWidth(2)
-        BVinG[i].SetMarkerStyle(MARKERS[i])
-        BVinG[i].SetMarkerSize(2)
-        BVinG[i].SetMarkerColor(COLORS[i])
-
-    for i in range(len(readings[0]["Vin"])):
-        VinG.append(TGraph())
-        VinG[i].SetLineColor(COLORS[i])
-        VinG[i].SetLineWidth(2)
-        VinG[i].SetMarkerStyle(MARKERS[i])
-        VinG[i].SetMarkerSize(2)
-        VinG[i].SetMarkerColor(COLORS[i])
-    '''
-
-    titles = {} # name, title, x-axis unit, y-axis unit
-    titles["temps"]  = ["Temp",      "Peltier Temperature (^{o}C)",  "Temp (^{o}C)",     "Entries"]
-    titles["hums"]   = ["Humidity",  "Peltier Humidity (%)",         "Humidity (%)",     "Entries"]
-    titles["peltV"]  = ["PeltV",     "Peltier Voltage (V)",          "Voltage (V)",      "Entries"]
-    titles["peltI"]  = ["PeltI",     "Peltier Current (A)",          "Current (A)",      "Entries"]
-    titles["BVin"]   = ["BVin",      "Bulk Bias Voltage (V)",        "Voltage (V)",      "Entries"]
-    titles["Vin"]    = ["Vin",       "Backplane Voltage (V)",        "Voltage (V)",      "Entries"]
-    titles["leakI"]  = ["LeakI",     "SiPM Leakage Current (\muA)",  "Current (\mA)",    "Entries"]
-    titles["cardT"]  = ["CardTemp",  "RM QIE Card Temperature (^{o}C)", "Temp (^{o}C)",     "Entries"]
-    titles["calibT"] = ["CalibTemp", "CU QIE Card Temperature (^{o}C)", "Temp (^{o}C)",     "Entries"]
-    titles["setV"]   = ["SetV",      "Set Peltier Voltage (V)",      "Voltage (V)",      "Entries"]
-    titles["targetT"] = ["TargetTemp", "Peltier Target Temperature (^{o}C)", "Temp (^{o}C)", "Entries"]
-    
-    histograms = {}
-    j = 0
-    for v in variables:
-        width = 0.15 * (varMaxs[v] - varMins[v])   # Sets the spacing around a TH1D plot based on the max/min vals
-        histograms[v] = TH1D(titles[v][0], titles[v][1], 50, varMins[v] - width, varMaxs[v] + width)
-        histograms[v].SetFillColor(COLORS[j])
-        histograms[v].GetXaxis().SetTitle(titles[v][2])
-        histograms[v].GetYaxis().SetTitle(titles[v][3])
-        histograms[v].GetYaxis().SetTitleOffset(2.1)
-        j += 1
-    
-    '''
-    # Book histograms
-    widthT = 0.15 * (varMaxs["temp"] - varMins["temp"])   # Sets the spacing around a TH1D plot based on the max/min vals
-    tempH = TH1D("Temp", "RBX Temperature (^{o}C)", 50, varMins["temp"] - widthT, varMaxs["temp"] + widthT)
-    tempH.SetFillColor(kRed)
-    tempH.GetXaxis().SetTitle("Temp (^{o}C)")
-    tempH.GetYaxis().SetTitle("Entries")
-    tempH.GetYaxis().SetTitleOffset(2.1)
-
-   
-    widthT = 0.15 * (varMaxs["hum"] - varMins["hum"])   # Sets the spacing around a TH1D plot based on the max/min vals
-    humH = TH1D("Humidity", "RBX Humidity (%)", 50, varMins["hum"] - widthH, varMaxs["hum"] + widthH)
-    humH.SetFillColor(kBlue)
-    humH.GetXaxis().SetTitle("Humidity (%)")
-    humH.GetYaxis().SetTitle("Entries")
-    humH.GetYaxis().SetTitleOffset(2.1)
-
-    widthPV = 0.15 * (maxPV - minPV)
-    peltVH = TH1D("PeltV", "RBX Peltier Voltage (V)", 50, minPV - widthPV, maxPV + widthPV)
-    peltVH.SetFillColor(kCyan+1)
-    peltVH.GetXaxis().SetTitle("Voltage (V)")
-    peltVH.GetYaxis().SetTitle("Entries")
-    peltVH.GetYaxis().SetTitleOffset(2.1)
-
-    widthPI = 0.15 * (maxPI - minPI)
-    peltIH = TH1D("PeltI", "RBX Peltier Current (A)", 50, minPI - widthPI, maxPI + widthPI)
-    peltIH.SetFillColor(kGreen+2)
-    peltIH.GetXaxis().SetTitle("Current (A)")
-    peltIH.GetYaxis().SetTitle("Entries")
-    peltIH.GetYaxis().SetTitleOffset(2.1)
-
-    widthBVin = 0.15 * (maxBVin - minBVin)
-    BVinH = TH1D("BVinH", "RBX Bulk Bias Voltage In (V)", 50, minBVin - widthBVin, maxBVin + widthBVin)
-    BVinH.SetFillColor(kViolet+1)
-    BVinH.GetXaxis().SetTitle("Voltage (V)")
-    BVinH.GetYaxis().SetTitle("Entries")
-    BVinH.GetYaxis().SetTitleOffset(2.1)
-    
-    widthVin = 0.15 * (maxVin - minVin)
-    VinH = TH1D("VinH", "RBX Backplane Voltage In (V)", 50, minVin - widthVin, maxVin + widthVin)
-    VinH.SetFillColor(kMagenta)
-    VinH.GetXaxis().SetTitle("Voltage (V)")
-    VinH.GetYaxis().SetTitle("Entries")
-    VinH.GetYaxis().SetTitleOffset(2.1)
-    
-    widthLI = 0.15 * (maxLI - minLI)
-    leakIH = TH1D("LeakI", "SiPM Leakage Current (\muA)", 50, minLI - widthLI, maxLI + widthLI)
-    leakIH.SetFillColor(kOrange)
-    leakIH.GetXaxis().SetTitle("Current (\muA)")
-    leakIH.GetYaxis().SetTitle("Entries")
-    leakIH.GetYaxis().SetTitleOffset(2.0)
-    leakIH.GetYaxis().SetTitleOffset(2.1)
-    '''
-
-    # Fill graphs, histos
-    for i,entry in enumerate(readings):
-        for v in variables:
-            for a in xrange(len(entry[v])):
-                value = entry[v][a]
-                histograms[v].Fill(value)
-                if v != "leakI":
-                    graphs[v][a].SetPoint(i, i, value)
-            
-        '''
-        for rm in range(len(entry["temp"])):
-            temp = entry["temp"][rm]
-            tempG[rm].SetPoint(i, i, temp)
-            tempH.Fill(temp)
-            
-        for rm in range(len(entry["hum"])):
-            hum = entry["hum"][rm]
-            humG[rm].SetPoint(i, i, hum)
-            humH.Fill(hum)
-        
-        for rm in range(len(entry["peltV"])):
-            peltV = entry["peltV"][rm]
-            peltVG[rm].SetPoint(i, i, peltV)
-            peltVH.Fill(peltV)
-
-        for rm in range(len(entry["peltI"])):
-            peltI = entry["peltI"][rm]
-            peltIG[rm].SetPoint(i, i, peltI)
-            peltIH.Fill(peltI)
-
-        for rm in range(len(entry["BVin"])):
-            BVin = entry["BVin"][rm]
-            BVinG[rm].SetPoint(i, i, BVin)
-            BVinH.Fill(BVin)
-        
-        for rm in range(len(entry["Vin"])):
-            Vin = entry["Vin"][rm]
-            VinG[rm].SetPoint(i, i, Vin)
-            VinH.Fill(Vin)
-  
-        for qie in range(len(entry["leakI"])):
-            leakI = entry["leakI"][qie]
-            leakIH.Fill(leakI)
-        '''
 
-    for v in variables:
-        # Make TH1D plots
-        plotHisto(histograms[v], "plots/%s_histo.png" % titles[v][0])
-        # Make TMultiGraph plots
-        if v != "leakI":
-            plotMultiGraph(readings, graphs[v], titles[v][1], "Time", titles[v][2], "plots/%s_graph.png" % titles[v][0]) 
-
-    ''' 
-    plotMultiGraph(readings, graphs["temp"],    "RBX Temperature (^{o}C)",      "Time", "Temp (^{o}C)", "plots/Temp_graph.png") 
-    plotMultiGraph(readings, graphs["hum"],     "RBX Humidity (%)",             "Time", "Humidity (%)", "plots/Hum_graph.png") 
-    plotMultiGraph(readings, graphs["peltV"],   "RBX Peltier Voltage (V)",      "Time", "Voltage (V)",  "plots/PeltV_graph.png") 
-    plotMultiGraph(readings, graphs["peltI"],   "RBX Peltier Current (A)",      "Time", "Current (A)",  "plots/PeltI_graph.png")
-    plotMultiGraph(readings, graphs["BVin"],    "RBX Bulk Bias Voltage In (V)", "Time", "Voltage (V)",  "plots/BVin_graph.png") 
-    plotMultiGraph(readings, graphs["Vin"],     "RBX Backplane Voltage In (V)", "Time", "Voltage (V)",  "plots/Vin_graph.png") 
+    if args.state:
+        # Histograms accumulate every entry since the state file was started
+        state = loadState(args.state)
+        cursor = int(state["cursor"])
+        if cursor > logLength(args.log):
+            print "Log is shorter than the state file expects, starting over:", args.state
+            state = {"cursor": 0}
+            cursor = 0
+        newReadings, newValues, state["cursor"] = readNewEntries(args.log, cursor, variables)
+        print "Read %d new entries from %s" % (len(newReadings), args.log)
+        for v in variables:
+            updateHisto(state, v, newValues[v])
+        saveState(args.state, state)
+        # Graphs show the --min/--max (or --start/--stop) range
+        readings, values = selectEntries(args, variables)
+    else:
+        readings, values = selectEntries(args, variables)
+        state = {}
+        for v in variables:
+            updateHisto(state, v, values[v])
 
-    # Make TH1D plots
-    plotHisto(tempH,    "plots/Temp_histo.png")
-    plotHisto(humH,     "plots/Hum_histo.png")
-    plotHisto(peltVH,   "plots/PeltV_histo.png")
-    plotHisto(peltIH,   "plots/PeltI_histo.png")
-    plotHisto(BVinH,    "plots/BVin_histo.png")
-    plotHisto(VinH,     "plots/Vin_histo.png") 
-    plotHisto(leakIH,   "plots/LeakI_histo.png")
-    '''
+    # Render each variable in its own process; only numpy arrays and plain values are sent to the workers
+    jobs = []
+    for j, v in enumerate(variables):
+        if v + "_edges" not in state:
+            print "No values for variable: %s" % v
+            continue
+        jobs.append((v, j, state[v + "_edges"], state[v + "_counts"], readings, values[v], args.out))
+    if args.jobs > 1 and len(jobs) > 1:
+        pool = Pool(min(args.jobs, len(jobs)))
+        pool.map(renderVariable, jobs)
+        pool.close()
+        pool.join()
+    else:
+        for job in jobs:
+            renderVariable(job)
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,41 @@
+#######################################################################
+#  conftest.py                                                        #
+#                                                                     #
+#  Shared setup for the checks in tests/: the repository is put on    #
+#  the import path and the fake ngFEC.exe in bench/ first on the      #
+#  PATH, so send_commands talks to it instead of real hardware.       #
+#                                                                     #
+#  python -m pytest tests                                             #
+#                                                                     #
+#######################################################################
+
+import os
+import sys
+import pytest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(tests_dir)
+bench_dir = os.path.join(repo_dir, "bench")
+sys.path.insert(0, repo_dir)
+os.environ["PATH"] = bench_dir + os.pathsep + os.environ.get("PATH", "")
+
+@pytest.fixture
+def fake_ngfec(tmpdir, monkeypatch):
+    """
+    Runs a test in its own directory (ngFEC scripts are written to the
+    working directory) and returns a function that configures the fake
+    ngFEC.exe spawned by the next session. Sessions are closed after
+    the test.
+    """
+    from sendCommands import close_sessions
+    monkeypatch.chdir(tmpdir)
+    def configure(latency=0, truncate=0, error=0, seed=1, log=""):
+        close_sessions()
+        monkeypatch.setenv("FAKE_NGFEC_LOG", str(log))
+        monkeypatch.setenv("FAKE_NGFEC_LATENCY", str(latency))
+        monkeypatch.setenv("FAKE_NGFEC_TRUNCATE", str(truncate))
+        monkeypatch.setenv("FAKE_NGFEC_ERROR", str(error))
+        monkeypatch.setenv("FAKE_NGFEC_SEED", str(seed))
+    configure()
+    yield configure
+    close_sessions()
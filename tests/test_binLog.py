@@ -0,0 +1,32 @@
+import pytest
+from binLog import appendRecord, replaceLastRecord, loadBinLog, isBinLog
+from reading import Reading
+
+layout = [("temps", 4), ("leakI", 8)]
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join("rbx.bin"))
+    reading = Reading(layout)
+    for t in range(3):
+        reading.clear()
+        reading["temps"][:] = [t, t + 1, t + 2, t + 3]
+        appendRecord(path, 100.0 + t, reading.layout, reading.buffer)
+    assert isBinLog(path)
+    schema, records = loadBinLog(path)
+    assert schema == layout
+    assert list(records["time"]) == [100.0, 101.0, 102.0]
+    assert list(records["temps"][2]) == [2, 3, 4, 5]
+    assert (records["leakI"] == -1).all()
+    reading["temps"][:] = 7
+    replaceLastRecord(path, 102.0, reading.buffer)
+    schema, records = loadBinLog(path, start=-1)
+    assert len(records) == 1 and list(records["temps"][0]) == [7, 7, 7, 7]
+
+def test_schema_checks(tmpdir):
+    path = str(tmpdir.join("rbx.bin"))
+    appendRecord(path, 1.0, layout, Reading(layout).buffer)
+    other = Reading([("temps", 4), ("leakI", 6)])
+    with pytest.raises(ValueError):
+        appendRecord(path, 2.0, other.layout, other.buffer)
+    with pytest.raises(ValueError):
+        appendRecord(path, 2.0, layout, other.buffer)
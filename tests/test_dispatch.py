@@ -0,0 +1,46 @@
+import json
+from dispatch import expandCmd, getCmdLayout, getDispatch, loadVariables, makeReading, fillChannels, variables
+
+def test_expand_cmd():
+    assert list(expandCmd("tget HE1-[1-2]-Vin_f fnr")) == ["HE1-1-Vin_f", "HE1-2-Vin_f"]
+    assert list(expandCmd("tget HB0-[1-2]-[3-4]-B_SHT_temp_f fnr")) == [
+        "HB0-1-3-B_SHT_temp_f", "HB0-1-4-B_SHT_temp_f", "HB0-2-3-B_SHT_temp_f", "HB0-2-4-B_SHT_temp_f"]
+    assert list(expandCmd("get fec1-firmware_version")) == ["fec1-firmware_version"]
+    assert getCmdLayout(["tget HE1-[1-4]-LeakageCurrent[1-48]_f fnr"])["expected"].values() == [192]
+
+def test_dispatch():
+    cmds = [
+        "tget HE1-[1-4]-Vin_f fnr",
+        "tget HE1-[1-4]-rtdtemperature_f fnr",
+        "tget HE1-[1-2]-LeakageCurrent[1-48]_f fnr",
+        "tget HE1-[3-4]-LeakageCurrent[1-48]_f fnr",
+        "get fec1-firmware_version",
+    ]
+    dispatch = getDispatch(cmds)
+    # Variables are in log order, not command order
+    assert dispatch["order"] == ["temps", "Vin", "leakI"]
+    assert dispatch["counts"] == {"temps": 4, "Vin": 4, "leakI": 192}
+    assert dispatch["table"][cmds[3]] == ("leakI", slice(96, 192), 96)
+    assert cmds[4] not in dispatch["table"]
+    assert dispatch["branches"]["leakI"] == "LeakageCurrent"
+    assert getDispatch(list(cmds)) is dispatch
+
+def test_fill_channels():
+    cmds = ["tget HE1-[1-4]-Vin_f fnr", "tget HE1-[1-4]-BVin_f fnr"]
+    reading = makeReading(cmds)
+    assert reading.layout == [("BVin", 4), ("Vin", 4)]
+    fillChannels(reading, getDispatch(cmds)["table"][cmds[0]], [1.0, 2.0])
+    assert list(reading["Vin"]) == [1, 2, -1, -1]
+
+def test_load_variables(tmpdir):
+    config = tmpdir.join("vars.json")
+    config.write(json.dumps([
+        {"name": "hvMon", "match": "-HVmon_f$"},
+        {"name": "hums", "match": "-humidity_f$", "branch": "humidity2"},
+    ]))
+    loaded = loadVariables(str(config))
+    # A redeclared default keeps its place, so the text log columns don't move
+    assert [v[0] for v in loaded] == [v[0] for v in variables] + ["hvMon"]
+    assert loaded[1] == ("hums", "-humidity_f$", "humidity2")
+    assert loaded[-1] == ("hvMon", "-HVmon_f$", "hvMon")
+    assert loadVariables(None) == variables
@@ -0,0 +1,43 @@
+import os
+from logIndex import tailLines, readLines, updateIndex, indexName, ITEM
+
+def writeLog(log, first, last):
+    with open(str(log), "a") as f:
+        for i in range(first, last + 1):
+            f.write("2017-07-05 12:00:00 %d \n" % i)
+
+def test_tail_lines(tmpdir):
+    log = tmpdir.join("rbx.log")
+    writeLog(log, 1, 5)
+    assert tailLines(str(log), 2) == ["2017-07-05 12:00:00 4 \n", "2017-07-05 12:00:00 5 \n"]
+    assert len(tailLines(str(log), 10)) == 5
+    assert tailLines(str(log), 0) == []
+    # A line still being written is left out
+    log.write("2017-07-05 12:00:20 6", mode="a")
+    assert tailLines(str(log), 1) == ["2017-07-05 12:00:00 5 \n"]
+
+def test_read_lines(tmpdir):
+    log = tmpdir.join("rbx.log")
+    writeLog(log, 1, 100)
+    lines = readLines(str(log), 10, 12)
+    assert [n for n, line in lines] == [10, 11, 12]
+    assert lines[0][1].split()[2] == "10"
+    assert len(readLines(str(log))) == 100
+    assert [n for n, line in readLines(str(log), -3, -2)] == [-3, -2]
+    assert readLines(str(log), 50, 10) == []
+
+def test_index_is_appended_to(tmpdir):
+    log = tmpdir.join("rbx.log")
+    writeLog(log, 1, 10)
+    assert updateIndex(str(log)) == 10
+    size = os.path.getsize(indexName(str(log)))
+    writeLog(log, 11, 15)
+    log.write("2017-07-05 12:00:20 16", mode="a")
+    assert updateIndex(str(log)) == 15
+    assert os.path.getsize(indexName(str(log))) == size + 5 * ITEM
+    assert readLines(str(log), 15, 0)[0][1].split()[2] == "15"
+    # A log that shrank (e.g. was rotated) is indexed again
+    log.write("")
+    writeLog(log, 1, 3)
+    assert updateIndex(str(log)) == 3
+    assert readLines(str(log), 3, 3)[0][1].split()[2] == "3"
@@ -0,0 +1,44 @@
+import random
+from onlineStats import OnlineStats
+
+def makeStats(tmpdir, config=None, n=20):
+    stats = OnlineStats(str(tmpdir.join("stats.json")), config, str(tmpdir.join("alarms.log")))
+    random.seed(1)
+    for i in range(n):
+        stats.update({"hums": [random.gauss(5, 0.1) for ch in range(4)]}, "2017-07-05 12:00:00")
+    return stats
+
+def test_no_alarms_while_stable(tmpdir):
+    stats = makeStats(tmpdir)
+    assert stats.update({"hums": [5.0, 5.05, 4.95, 5.0]}) == []
+    assert not tmpdir.join("alarms.log").check()
+
+def test_z_and_threshold_alarms(tmpdir):
+    stats = makeStats(tmpdir, {"hums": {"max": 6.0}})
+    alarms = stats.update({"hums": [8.0, 5.0, 5.0, 5.0]})
+    assert len(alarms) == 2
+    assert "above max" in alarms[0] and "sigma" in alarms[1]
+    assert len(tmpdir.join("alarms.log").readlines()) == 2
+
+def test_warmup(tmpdir):
+    stats = makeStats(tmpdir, n=5)
+    assert stats.update({"hums": [8.0, 5.0, 5.0, 5.0]}) == []
+
+def test_missing_values_raise_one_alarm_and_are_not_added(tmpdir):
+    stats = makeStats(tmpdir, {"hums": {"min": 0}})
+    mean, m2 = list(stats.stats["hums"]["mean"]), list(stats.stats["hums"]["m2"])
+    alarms = stats.update({"hums": [-1, -1, float("nan"), -1]})
+    assert alarms == ["hums: 4 of 4 channels missing or ERROR (0, 1, 2, 3)"]
+    assert stats.stats["hums"]["n"] == [20, 20, 20, 20]
+    assert stats.stats["hums"]["mean"] == mean and stats.stats["hums"]["m2"] == m2
+    # The variance is untouched, so a real excursion is still caught
+    assert len(stats.update({"hums": [5.6, 5.0, 5.0, 5.0]})) == 1
+
+def test_missing_alarm_can_be_turned_off(tmpdir):
+    stats = makeStats(tmpdir, {"hums": {"missing": False}})
+    assert stats.update({"hums": [-1, 5.0, 5.0, 5.0]}) == []
+
+def test_checkpoint_survives_restart(tmpdir):
+    makeStats(tmpdir)
+    stats = OnlineStats(str(tmpdir.join("stats.json")), None, str(tmpdir.join("alarms.log")))
+    assert stats.stats["hums"]["n"] == [20, 20, 20, 20]
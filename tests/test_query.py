@@ -0,0 +1,65 @@
+import numpy as np
+from binLog import appendRecord
+from query import query, toEpoch, timeIndexName
+
+def writeLog(path, nLines, nValues):
+    with open(path, "w") as f:
+        for i in range(nLines):
+            values = " ".join("%d" % (i * 1000 + j) for j in range(nValues))
+            f.write("2017-07-05 12:%02d:%02d %s \n" % (i / 60, i % 60, values))
+
+def test_text_log_is_padded_to_the_full_layout(tmpdir):
+    # 24 values for temps..Vin, then 192 of the 256 leakage currents
+    log = str(tmpdir.join("he.log"))
+    writeLog(log, 10, 24 + 192)
+    times, values = query(log)
+    assert len(times) == 10
+    assert values["leakI"].shape == (10, 256)
+    assert (values["leakI"][:, :192] >= 0).all()
+    assert np.isnan(values["leakI"][:, 192:]).all()
+    assert np.isnan(values["cardT"]).all() and values["cardT"].shape == (10, 16)
+    assert list(values["hums"][3]) == [3004, 3005, 3006, 3007]
+
+def test_short_lines_are_padded(tmpdir):
+    log = tmpdir.join("short.log")
+    log.write("2017-07-05 12:00:00 1 2 3 4 5 \n2017-07-05 12:00:20 1 2 \n")
+    times, values = query(str(log), variables=["temps", "hums"])
+    assert list(values["temps"][1][:2]) == [1, 2]
+    assert np.isnan(values["temps"][1][2:]).all()
+    assert values["hums"][0][0] == 5 and np.isnan(values["hums"][0][1:]).all()
+
+def test_time_range_and_channels(tmpdir):
+    log = str(tmpdir.join("rbx.log"))
+    writeLog(log, 1000, 8)
+    start, stop = toEpoch("2017-07-05 12:10"), toEpoch("2017-07-05 12:12")
+    times, values = query(log, "2017-07-05 12:10", "2017-07-05 12:12", ["hums"], {"hums": [2]})
+    assert len(times) == 120
+    assert times[0] == start and times[-1] == stop - 1
+    assert values["hums"].shape == (120, 1)
+    assert values["hums"][0][0] == 600 * 1000 + 6
+    # A second query reuses and extends the index
+    with open(log, "a") as f:
+        f.write("2017-07-05 12:20:00 1 2 3 4 5 6 7 8 \n2017-07-05 12:20:20 1 2")
+    times, values = query(log, "2017-07-05 12:20")
+    assert len(times) == 1     # The half-written last line is left out
+    assert tmpdir.join("rbx.log.tidx").check() and timeIndexName(log).endswith(".tidx")
+
+def test_binary_log_missing_variable(tmpdir):
+    log = str(tmpdir.join("rbx.bin"))
+    for t in range(5):
+        appendRecord(log, 100.0 + t, [("hums", 4)], np.full(4, t, dtype=np.float32))
+    times, values = query(log, 101, 103, ["hums", "leakI"])
+    assert list(times) == [101.0, 102.0]
+    assert list(values["hums"][1]) == [2, 2, 2, 2]
+    assert values["leakI"].shape == (2, 0)
+
+def test_missing_values_are_nan(tmpdir):
+    # -1 is what takeReading logs for channels that were not read or returned an ERROR
+    log = tmpdir.join("rbx.log")
+    log.write("2017-07-05 12:00:00 1 -1 3 4 \n")
+    times, values = query(str(log), variables=["temps"])
+    assert np.isnan(values["temps"][0][1]) and values["temps"][0][2] == 3
+    binary = str(tmpdir.join("rbx.bin"))
+    appendRecord(binary, 100.0, [("hums", 2)], np.array([-1, 2], dtype=np.float32))
+    times, values = query(binary)
+    assert np.isnan(values["hums"][0][0]) and values["hums"][0][1] == 2
@@ -0,0 +1,40 @@
+import numpy as np
+from report import makeReport, writeCSV
+
+def makeSnapshots(values):
+    values = np.array(values, dtype=float)
+    return {
+        "names": np.array(["humidity-%d" % i for i in range(len(values))]),
+        "dates": np.array(["2017-06-21", "2017-06-22", "2017-06-24"][:len(values)], dtype="datetime64[D]"),
+        "channels": np.array(["HE1-%d" % (i + 1) for i in range(values.shape[1])]),
+        "values": values,
+    }
+
+def test_report():
+    nan = float("nan")
+    snapshots = makeSnapshots([
+        [5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 9.0],
+        [5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 9.0],
+        [5.0, 5.0, 5.0, 5.0, 5.0, 5.0, nan, 13.0],
+    ])
+    report = makeReport(snapshots, z=2.0)
+    stats = report["stats"]
+    assert list(stats["n"]) == [3, 3, 3, 3, 3, 3, 2, 3]
+    assert stats["latest"][6] == 5.0 and stats["latest"][7] == 13.0
+    # The last two snapshots are two days apart
+    assert stats["last_delta_per_day"][7] == 2.0
+    # Least squares over days 0, 1 and 3
+    assert abs(stats["slope_per_day"][7] - 10.0 / 7) < 1e-9
+    assert stats["slope_per_day"][0] == 0 and stats["slope_per_day"][6] == 0
+    assert report["order"][0] == 7 and stats["rank"][7] == 1
+    assert stats["outlier_days"][7] == 3
+
+def test_csv(tmpdir):
+    snapshots = makeSnapshots([[5.0, 6.0], [5.5, float("nan")]])
+    report = makeReport(snapshots)
+    writeCSV("humidity", snapshots, report, str(tmpdir))
+    rows = tmpdir.join("humidity_report.csv").read().splitlines()
+    assert rows[0].startswith("rm,rank,n,mean")
+    assert len(rows) == 3
+    deltas = tmpdir.join("humidity_deltas.csv").read().splitlines()
+    assert deltas[1] == "2017-06-22,0.5,"
@@ -0,0 +1,75 @@
+import numpy as np
+from binLog import loadBinLog
+from reading import Reading
+from rollup import Rollup, select, fromLog, rollupName
+
+def test_rollup_masks_missing_values(tmpdir):
+    prefix = str(tmpdir.join("rb"))
+    reading = Reading([("hums", 3)])
+    rollup = Rollup(prefix)
+    for values in ([1, -1, np.nan], [3, 5, -1], [2, -1, -1]):
+        reading.buffer[:] = values
+        rollup.add(120.0, reading)
+    schema, records = loadBinLog(rollupName(prefix, "1min"))
+    assert len(records) == 1
+    assert records["count"][0][0] == 3
+    assert list(records["hums_n"][0]) == [3, 1, 0]
+    assert list(records["hums_min"][0][:2]) == [1, 5]
+    assert list(records["hums_mean"][0][:2]) == [2, 5]
+    assert list(records["hums_max"][0][:2]) == [3, 5]
+    assert np.isnan(records["hums_mean"][0][2])
+    # A restarted Rollup resumes the open bucket
+    reading.buffer[:] = [10, 10, 10]
+    Rollup(prefix).add(130.0, reading)
+    schema, records = loadBinLog(rollupName(prefix, "1min"))
+    assert len(records) == 1
+    assert list(records["hums_n"][0]) == [4, 2, 1]
+    assert list(records["hums_mean"][0]) == [4, 7.5, 10]
+    # New buckets and select
+    reading.buffer[:] = [20, 20, 20]
+    Rollup(prefix).add(190.0, reading)
+    resolution, times, values = select(prefix, width=2)
+    assert resolution == "1min"
+    assert list(times) == [120.0, 180.0]
+    assert list(values["hums"][1]) == [20, 20, 20]
+
+def test_rollup_starts_new_files_for_a_new_schema(tmpdir):
+    prefix = str(tmpdir.join("rb"))
+    Rollup(prefix).add(60.0, Reading([("hums", 3)]))
+    reading = Reading([("hums", 4)])
+    reading.buffer[:] = 1
+    Rollup(prefix).add(120.0, reading)
+    schema, records = loadBinLog(rollupName(prefix, "1min"))
+    assert ("hums_mean", 4) in schema
+    assert len(records) == 1
+    assert len(tmpdir.listdir(lambda p: ".bin." in p.basename)) == 3
+
+def test_backfill_matches_live_layout(tmpdir):
+    # An HE text log has 7 variables and 192 leakage currents, not the full 11 x 256 layout
+    log = tmpdir.join("he.log")
+    row = " ".join(["1.5"] * 24 + ["0.25"] * 192)
+    log.write("".join("2017-07-05 12:00:%02d %s \n" % (s, row) for s in range(0, 60, 20)))
+    prefix = str(tmpdir.join("rb"))
+    assert fromLog(str(log), prefix) == 3
+    live = Reading([("temps", 4), ("hums", 4), ("peltV", 4), ("peltI", 4), ("BVin", 4), ("Vin", 4), ("leakI", 192)])
+    live.buffer[:] = 2
+    Rollup(prefix).add(1e10, live)     # Raised "does not match the schema" before
+    schema, records = loadBinLog(rollupName(prefix, "1min"))
+    assert len(records) == 2
+    assert list(records["count"][:, 0]) == [3, 1]
+
+def test_select_merges_buckets(tmpdir):
+    # A day of 1 minute buckets is merged down to about width points
+    prefix = str(tmpdir.join("rb"))
+    reading = Reading([("hums", 2), ("peltV", 1)])
+    rollup = Rollup(prefix, resolutions=[("1min", 60)])
+    for minute in range(1440):
+        reading.buffer[:] = [minute, -1 if minute % 2 else 100, 1]
+        rollup.add(minute * 60.0, reading)
+    resolution, times, values = select(prefix, width=100, variables=["hums", "leakI"])
+    assert resolution == "1min"
+    assert len(times) <= 100 and times[1] - times[0] == 15 * 60
+    assert list(values["hums"][0]) == [7, 100]
+    assert values["leakI"].shape == (len(times), 0)
+    resolution, times, values = select(prefix, width=100, variables=["hums"], stat="max")
+    assert list(values["hums"][-1]) == [1439, 100]
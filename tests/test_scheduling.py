@@ -0,0 +1,44 @@
+import scheduling
+from scheduling import schedule
+
+class FakeClock(object):
+    # Stands in for monotonic and sleep: time only moves when sleeping or taking a reading
+    def __init__(self, monkeypatch):
+        self.now = 0.0
+        self.sleeps = []
+        monkeypatch.setattr(scheduling, "monotonic", lambda: self.now)
+        monkeypatch.setattr(scheduling, "sleep", self.sleep)
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def run(clock, durations, policy, logName=None):
+    # Runs a 10 step interval, each reading taking the given time
+    runs = []
+    for runNum in schedule(10, 100, policy, logName):
+        runs.append((runNum, clock.now))
+        clock.now += durations.get(runNum, 1)
+    return runs
+
+def test_fixed_grid(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    runs = run(clock, {}, "skip")
+    assert runs == [(n + 1, n * 10.0) for n in range(10)]
+    assert clock.sleeps == [9.0] * 9
+
+def test_overrun_skips_ticks(monkeypatch, tmpdir):
+    clock = FakeClock(monkeypatch)
+    log = tmpdir.join("action.log")
+    runs = run(clock, {2: 25}, "skip", str(log))
+    # Reading 2 ends at 35, past the ticks at 20 and 30, so run 5 at 40 is next
+    assert [r for r, t in runs] == [1, 2, 5, 6, 7, 8, 9, 10]
+    assert all(t == (r - 1) * 10.0 for r, t in runs)
+    assert "Overrun: reading 2" in log.read()
+
+def test_overrun_compress(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    runs = run(clock, {2: 25}, "compress")
+    # The missed ticks are replaced by one reading straight away
+    assert runs[2] == (4, 35.0)
+    assert runs[3] == (5, 40.0)
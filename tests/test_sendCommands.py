@@ -0,0 +1,110 @@
+import os
+import time
+import pexpect
+import pytest
+from sendCommands import read_records, send_commands, poll_targets, get_session, sessions
+
+class FakeSpawn(object):
+    # Just enough of a pexpect.spawn for read_records: output arrives in the given chunks
+    def __init__(self, chunks):
+        self.buffer = ""
+        self.chunks = list(chunks)
+
+    def read_nonblocking(self, size, timeout):
+        if not self.chunks:
+            raise pexpect.TIMEOUT("no more output")
+        return self.chunks.pop(0)
+
+def test_read_records_waits_for_whole_lines():
+    cmds = ["tget HE1-[1-4]-Vin_f fnr", "tget HE1-[1-4]-BVin_f fnr"]
+    p = FakeSpawn([
+        "Fake ngFEC\nngccm >< script\n",
+        "tget HE1-[1-4]-Vin_f fnr # 1.0 2.0 ",      # Result cut in the middle of the line
+        "3.0 4.0\ntget HE1-[1-4]-BVin_f fnr # ERROR!! no reply\nngccm >",
+    ])
+    records = list(read_records(p, cmds))
+    assert [r["cmd"] for r in records] == cmds
+    assert records[0]["result"] == "1.0 2.0 3.0 4.0"
+    assert records[1]["result"].startswith("ERROR")
+    assert p.buffer == "ngccm >"
+
+def test_read_records_skips_other_commands():
+    cmds = ["tget HE1-[1-4]-Vin_f fnr"]
+    p = FakeSpawn(["tget HE1-[1-4]-BVin_f fnr # 9.0\r\ntget HE1-[1-4]-Vin_f fnr # 1.5\r\n"])
+    records = list(read_records(p, cmds))
+    assert records[0]["result"] == "1.5"
+
+def test_read_records_deadline():
+    p = FakeSpawn([])
+    t0 = time.time()
+    with pytest.raises(pexpect.TIMEOUT):
+        list(read_records(p, ["get x"], first_timeout=30, deadline=t0 + 0.2))
+    assert time.time() - t0 < 5
+
+@pytest.mark.parametrize("script", [True, False])
+def test_send_commands(fake_ngfec, script):
+    cmds = ["tget HE1-[1-4]-Vin_f fnr", "tget HE1-[1-4]-LeakageCurrent[1-48]_f fnr"]
+    for i in range(3):
+        results = send_commands(cmds=list(cmds), script=script, port=1, control_hub="fake", persistent=True)
+        assert [r["cmd"] for r in results] == cmds
+        if script:
+            assert [len(r["result"].split()) for r in results] == [4, 192]
+    assert get_session(1, "fake").spawns == 1
+    assert not [f for f in os.listdir(".") if f.startswith("ngfec_script")]
+
+def test_erroring_session_is_respawned(fake_ngfec):
+    fake_ngfec(error=1)
+    cmds = ["tget HE1-[1-4]-Vin_f fnr"]
+    send_commands(cmds=list(cmds), script=True, port=1, control_hub="fake", persistent=True)
+    send_commands(cmds=list(cmds), script=True, port=1, control_hub="fake", persistent=True)
+    assert get_session(1, "fake").spawns == 2
+
+@pytest.mark.parametrize("script", [True, False])
+def test_commands_are_sent_once(fake_ngfec, tmpdir, script):
+    # A pooled session must never replay the caller's commands, e.g. to check it is alive
+    log = tmpdir.join("received.log")
+    fake_ngfec(log=log)
+    cmds = ["put HB0-[1-4]-SetPeltierVoltage_f 4*5.0", "tget HB0-[1-4]-Vin_f fnr"]
+    for i in range(3):
+        send_commands(cmds=list(cmds), script=script, port=1, control_hub="fake", persistent=True)
+    assert log.read().splitlines() == cmds * 3
+
+def test_probe(fake_ngfec, tmpdir):
+    log = tmpdir.join("received.log")
+    fake_ngfec(log=log)
+    session = get_session(1, "fake")
+    session.probe = "get fec1-firmware_version"
+    cmds = ["tget HB0-[1-4]-Vin_f fnr"]
+    send_commands(cmds=list(cmds), script=True, port=1, control_hub="fake", persistent=True)
+    send_commands(cmds=list(cmds), script=True, port=1, control_hub="fake", persistent=True)
+    assert log.read().splitlines() == [cmds[0], session.probe, cmds[0]]
+    assert session.spawns == 1
+
+def test_poll_targets_per_target_commands(fake_ngfec):
+    # Different command lists on every target, as rbxMon.readRMs sends for HE and HB
+    cmds = {
+        ("he", 64100): ["tget HE1-[1-4]-Vin_f fnr", "tget HE1-[1-4]-LeakageCurrent[1-48]_f fnr"],
+        ("hb", 64400): ["tget HB1-[1-4]-BVin_f fnr", "tget HB1-[1-4]-LeakageCurrent[1-64]_f fnr", "tget HB1-calib-B_SHT_temp_f fnr"],
+    }
+    for sweep in range(5):
+        reading = poll_targets(cmds.keys(), cmds, timeout=20)
+        assert reading["timeouts"] == []
+        assert reading["errors"] == {}
+        for target in cmds:
+            assert [r["cmd"] for r in reading["results"][target]] == cmds[target]
+    assert not [f for f in os.listdir(".") if f.startswith("ngfec_script")]
+
+def test_poll_targets_timeout_releases_target(fake_ngfec):
+    fake_ngfec(latency=2)
+    cmds = {("slow", 1): ["tget HE1-[1-4]-Vin_f fnr"] * 3}
+    t0 = time.time()
+    reading = poll_targets(cmds.keys(), cmds, timeout=1)
+    assert reading["timeouts"] == [("slow", 1)]
+    assert reading["results"][("slow", 1)] is None
+    assert ("slow", 1) not in sessions
+    # The next sweep gets a fresh session instead of waiting for the old one
+    fake_ngfec(latency=0)
+    reading = poll_targets(cmds.keys(), cmds, timeout=10)
+    assert reading["timeouts"] == []
+    assert len(reading["results"][("slow", 1)]) == 3
+    assert time.time() - t0 < 8
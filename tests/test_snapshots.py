@@ -0,0 +1,35 @@
+import os
+import numpy as np
+from snapshots import loadSnapshots, cacheName
+
+def writeSnapshot(directory, name, values):
+    snapshot = directory.join(name + ".txt")
+    snapshot.write("# tget HE[1-18]-[1-4]-humidityS_f nr # \n" + "".join("%s-humidityS_f %s\n" % cv for cv in values))
+    return snapshot
+
+def test_matrix(tmpdir):
+    writeSnapshot(tmpdir, "humidity-3-JUL-2017", [("HE10-1", 7.0), ("HE2-1", 6.0)])
+    writeSnapshot(tmpdir, "humidity-21-JUN-2017", [("HE2-1", 5.0), ("HE2-2", 5.5)])
+    writeSnapshot(tmpdir, "temperature-21-JUN-2017", [("HE2-1", 20.0)])
+    snapshots = loadSnapshots("humidity", str(tmpdir))
+    # Sorted by date and by RBX number, not by name
+    assert list(snapshots["names"]) == ["humidity-21-JUN-2017", "humidity-3-JUL-2017"]
+    assert [str(d) for d in snapshots["dates"]] == ["2017-06-21", "2017-07-03"]
+    assert list(snapshots["channels"]) == ["HE2-1", "HE2-2", "HE10-1"]
+    assert list(snapshots["values"][0][:2]) == [5.0, 5.5] and np.isnan(snapshots["values"][0][2])
+    assert list(snapshots["values"][1][[0, 2]]) == [6.0, 7.0]
+
+def test_cache(tmpdir):
+    snapshot = writeSnapshot(tmpdir, "humidity-21-JUN-2017", [("HE1-1", 5.0)])
+    loadSnapshots("humidity", str(tmpdir))
+    cache = cacheName("humidity", str(tmpdir))
+    assert os.path.exists(cache)
+    mtime = os.path.getmtime(cache)
+    assert loadSnapshots("humidity", str(tmpdir))["values"][0][0] == 5.0
+    assert os.path.getmtime(cache) == mtime
+    # A changed or added snapshot rebuilds the cache
+    writeSnapshot(tmpdir, "humidity-21-JUN-2017", [("HE1-1", 6.0)])
+    os.utime(str(snapshot), (mtime + 10, mtime + 10))
+    assert loadSnapshots("humidity", str(tmpdir))["values"][0][0] == 6.0
+    writeSnapshot(tmpdir, "humidity-22-JUN-2017", [("HE1-1", 7.0)])
+    assert len(loadSnapshots("humidity", str(tmpdir))["names"]) == 2
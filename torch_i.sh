@@ -1,10 +1,7 @@
 logfile="torch.log"
-host="cms904usr"
-dir="$(pwd)"
+dir="$(cd "$(dirname "$0")" && pwd)"
 
-ssh -T $host << EOF
-  cd $dir
-  echo "V2O?;I2O?" | nc localhost 39221
-  echo "$(date) Read voltage and current." >> $logfile
-  echo "V2O?;I2O?" | nc localhost 39221 >> $logfile
-EOF
+# The collector (collector.sh) keeps the connection to the power supply open
+$dir/collector.py --send "V2O?;I2O?"
+echo "$(date) Read voltage and current." >> $logfile
+$dir/collector.py --send "V2O?;I2O?" >> $logfile
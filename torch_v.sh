@@ -1,12 +1,9 @@
 logfile="torch.log"
-host="cms904usr"
-dir="$(pwd)"
+dir="$(cd "$(dirname "$0")" && pwd)"
 
-ssh -T $host << EOF
-  cd $dir
-  echo "V2V $1" | nc localhost 39221
-  sleep 1
-  echo "V2O?; I2O?" | nc localhost 39221
-  echo "$(date) Set voltage to $1" >> $logfile
-  echo "V2O?;I2O?" | nc localhost 39221 >> $logfile
-EOF
+# The collector (collector.sh) keeps the connection to the power supply open
+$dir/collector.py --send "V2V $1"
+sleep 1
+$dir/collector.py --send "V2O?; I2O?"
+echo "$(date) Set voltage to $1" >> $logfile
+$dir/collector.py --send "V2O?;I2O?" >> $logfile